@@ -0,0 +1,297 @@
+"""
+active_alarm_index.py
+
+Process-local index of active ROOT alarms used for correlation, for
+every rule in correlation_rules.json (see correlation_rules.py), and
+the mirror index of stored CHILD alarms used to retract children whose
+root arrived after them.
+
+Warmed once from active_alarms at startup, then kept current by
+handle_alarm_lifecycle on upsert and CLEAR, so drop_reason never has
+to query Postgres on the hot path.
+
+Per rule, indexed alarms are bucketed by each of the rule's match keys.
+Each bucket is kept sorted by first_detected, so the time-window check
+is a bisect over epoch milliseconds.
+
+Expiry: an alarm can only correlate with alarms first detected within
+its window, so once the event-time watermark (newest first_detected
+looked up) passes alarm + window + lateness it is evicted from its buckets.
+Evictions come off a min-heap ordered by that expiry time, which keeps
+the cost per event O(log n) however many alarms stay active. Alarms
+delivered more than `lateness` late are not correlated. The watermark
+never runs ahead of the wall clock, so an NE with a skewed clock cannot
+evict alarms early.
+"""
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from correlation_rules import get_correlation_rules
+from time_utils import iso_to_epoch_ms
+
+
+# -------------------------------
+# Root alarm classification
+# -------------------------------
+def is_root(alarm):
+    """
+    True if `alarm` is a root of any correlation rule.
+    """
+    return get_correlation_rules().is_root(alarm)
+
+
+# -------------------------------
+# Time-sorted buckets
+# -------------------------------
+class TimeBuckets:
+    """
+    key -> list of (epoch_ms, alarm_id), sorted by time.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+
+    def add(self, key, ts, alarm_id):
+        insort(self._buckets.setdefault(key, []), (ts, alarm_id))
+
+    def discard(self, key, ts, alarm_id):
+        bucket = self._buckets.get(key)
+        if not bucket:
+            return
+
+        i = bisect_left(bucket, (ts, alarm_id))
+        if i < len(bucket) and bucket[i] == (ts, alarm_id):
+            del bucket[i]
+        if not bucket:
+            del self._buckets[key]
+
+    def any_within(self, key, ts, window):
+        bucket = self._buckets.get(key)
+        if not bucket:
+            return False
+
+        i = bisect_left(bucket, (ts - window,))
+        return i < len(bucket) and bucket[i][0] <= ts + window
+
+    def within(self, key, ts, window):
+        """
+        alarm_ids in `key` within `window` of `ts`.
+        """
+        bucket = self._buckets.get(key)
+        if not bucket:
+            return []
+
+        i = bisect_left(bucket, (ts - window,))
+        j = bisect_left(bucket, (ts + window + 1,))
+        return [alarm_id for _, alarm_id in bucket[i:j]]
+
+
+# -------------------------------
+# Index
+# -------------------------------
+class ActiveAlarmIndex:
+    def __init__(self, rules=None, expire=True, clock=time.time, side="root"):
+        """
+        rules:  CorrelationRules (default: correlation_rules.json)
+        expire: evict alarms by watermark; off for offline re-evaluation
+                of stored alarms in arbitrary time order
+        side:   "root" indexes roots and looks up children,
+                "child" indexes children and looks up roots
+        """
+        if side not in ("root", "child"):
+            raise ValueError(f"side must be 'root' or 'child', not {side!r}")
+        self._rules = rules
+        self.side = side
+        self.expire = expire
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.warmed = False
+        self._reset()
+
+    @property
+    def rules(self):
+        if self._rules is None:
+            self._rules = get_correlation_rules()
+        return self._rules
+
+    def _indexed_rules(self, alarm):
+        if self.side == "root":
+            return self.rules.root_rules(alarm)
+        return self.rules.child_rules(alarm)
+
+    def _lookup_rules(self, alarm):
+        if self.side == "root":
+            return self.rules.child_rules(alarm)
+        return self.rules.root_rules(alarm)
+
+    def _reset(self):
+        self._alarms = {}      # alarm_id -> alarm
+
+        # alarm_id -> [(rule index, key, ts), ...] for removal
+        self._entries = {}
+        self._buckets = {}     # rule index -> TimeBuckets
+
+        # (expires_at, ts, rule index, key, alarm_id)
+        self._expiry = []
+        self._watermark = None
+
+    def warm(self, alarms):
+        """
+        Replace the index contents with the given stored alarms.
+        """
+        with self._lock:
+            self._reset()
+            for alarm in alarms:
+                self._add(alarm)
+            self.warmed = True
+
+    def upsert(self, alarm):
+        """
+        Track (or stop tracking) an alarm that was written to active_alarms.
+        """
+        alarm_id = alarm.get("alarm_id")
+        if not alarm_id:
+            return
+
+        with self._lock:
+            self._remove(alarm_id)
+            self._add(alarm)
+
+    def remove(self, alarm_id):
+        with self._lock:
+            self._remove(alarm_id)
+
+    # ---------------------------
+    # Internal (lock held)
+    # ---------------------------
+    def _add(self, alarm):
+        alarm_id = alarm.get("alarm_id")
+        if not alarm_id:
+            return
+
+        rule_indexes = self._indexed_rules(alarm)
+        if not rule_indexes:
+            return
+
+        self._alarms[alarm_id] = alarm
+
+        ts = iso_to_epoch_ms(alarm.get("first_detected"))
+        if ts is None:
+            return
+
+        entries = []
+        for i in rule_indexes:
+            rule = self.rules.rules[i]
+            for _, key_of in rule.keys:
+                key = key_of(alarm)
+                if not key:
+                    continue
+                self._buckets.setdefault(i, TimeBuckets()).add(key, ts, alarm_id)
+                entries.append((i, key, ts))
+                if self.expire:
+                    heapq.heappush(self._expiry, (ts + rule.window_ms + rule.lateness_ms, ts, i, key, alarm_id))
+
+        if entries:
+            self._entries[alarm_id] = entries
+
+    def _remove(self, alarm_id):
+        self._alarms.pop(alarm_id, None)
+
+        for i, key, ts in self._entries.pop(alarm_id, ()):
+            self._buckets[i].discard(key, ts, alarm_id)
+        # Heap entries of removed alarms are skipped lazily on expiry
+
+    def _advance(self, when_ms):
+        when_ms = min(when_ms, int(self._clock() * 1000))
+        if self._watermark is not None and when_ms <= self._watermark:
+            return
+        self._watermark = when_ms
+
+        while self._expiry and self._expiry[0][0] < when_ms:
+            _, ts, i, key, alarm_id = heapq.heappop(self._expiry)
+            entries = self._entries.get(alarm_id)
+            if not entries or (i, key, ts) not in entries:
+                continue   # removed / re-upserted since
+
+            self._buckets[i].discard(key, ts, alarm_id)
+            entries.remove((i, key, ts))
+            if not entries:
+                del self._entries[alarm_id]
+                self._alarms.pop(alarm_id, None)
+
+    # ---------------------------
+    # Correlation lookup
+    # ---------------------------
+    def correlated_rule(self, alarm, when_ms):
+        """
+        Name of the first rule under which `alarm` (first detected at
+        `when_ms`, epoch ms) is a child of an indexed root within the
+        rule's window, sharing any of its match keys; else None.
+        """
+        rule_indexes = self._lookup_rules(alarm)
+
+        with self._lock:
+            if self.expire:
+                self._advance(when_ms)
+
+            for i in rule_indexes:
+                buckets = self._buckets.get(i)
+                if buckets is None:
+                    continue
+                rule = self.rules.rules[i]
+                for _, key_of in rule.keys:
+                    key = key_of(alarm)
+                    if key and buckets.any_within(key, when_ms, rule.window_ms):
+                        return rule.name
+
+        return None
+
+    def correlated(self, alarm, when_ms):
+        """
+        [(rule name, alarm_id), ...] of every indexed alarm `alarm`
+        (first detected at `when_ms`) correlates with, e.g. the stored
+        children of a newly arrived root.
+        """
+        rule_indexes = self._lookup_rules(alarm)
+        found = {}
+
+        with self._lock:
+            if self.expire:
+                self._advance(when_ms)
+
+            for i in rule_indexes:
+                buckets = self._buckets.get(i)
+                if buckets is None:
+                    continue
+                rule = self.rules.rules[i]
+                for _, key_of in rule.keys:
+                    key = key_of(alarm)
+                    if not key:
+                        continue
+                    for alarm_id in buckets.within(key, when_ms, rule.window_ms):
+                        found.setdefault(alarm_id, rule.name)
+
+        return [(rule, alarm_id) for alarm_id, rule in found.items()]
+
+    # ---------------------------
+    # Snapshots
+    # ---------------------------
+    def alarms(self):
+        with self._lock:
+            return list(self._alarms.values())
+
+    def get(self, alarm_id):
+        with self._lock:
+            return self._alarms.get(alarm_id)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._alarms)
+
+
+# Shared instances for the consumer process
+active_index = ActiveAlarmIndex()
+active_children = ActiveAlarmIndex(side="child")
@@ -0,0 +1,70 @@
+"""
+alarm_dedup.py
+
+Process-local alarm_id -> content hash of what was last written to
+active_alarms, used to skip no-op upserts when NSP re-sends alarm-create
+for alarms we already hold (resync, reconnect).
+
+Entries are dropped on CLEAR / alarm-change and only recorded after the
+DB commit. They also expire after ALARM_DEDUP_TTL_SECONDS, so a row
+deleted behind the consumer's back (alarm_view delete-active,
+cleanup_alarms) is written again by the next re-send at the latest.
+
+Environment:
+  ALARM_DEDUP_TTL_SECONDS   entry lifetime (default 3600, 0 = disabled)
+"""
+
+import os
+import threading
+import time
+from hashlib import blake2b
+
+from codec import dumps
+
+ALARM_DEDUP_TTL_SECONDS = float(os.getenv("ALARM_DEDUP_TTL_SECONDS", "3600"))
+
+# Differs on every re-send without the alarm itself changing
+IMMATERIAL_FIELDS = frozenset({"event_time"})
+
+
+def content_hash(alarm):
+    """
+    8-byte digest of the alarm's material fields.
+    """
+    material = {k: v for k, v in alarm.items() if k not in IMMATERIAL_FIELDS}
+    return blake2b(dumps(material).encode(), digest_size=8).digest()
+
+
+class ContentHashMap:
+    def __init__(self, ttl=ALARM_DEDUP_TTL_SECONDS, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hashes = {}   # alarm_id -> (digest, expires_at)
+
+    def unchanged(self, alarm_id, digest):
+        """
+        True if `digest` is what was last written for alarm_id.
+        """
+        if self.ttl <= 0:
+            return False
+
+        entry = self._hashes.get(alarm_id)
+        return entry is not None and entry[0] == digest and entry[1] > self._clock()
+
+    def record(self, alarm_id, digest):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._hashes[alarm_id] = (digest, self._clock() + self.ttl)
+
+    def forget(self, alarm_id):
+        with self._lock:
+            self._hashes.pop(alarm_id, None)
+
+    def __len__(self):
+        return len(self._hashes)
+
+
+# Shared instance for the consumer process
+written_hashes = ContentHashMap()
@@ -4,64 +4,20 @@ alarm_filters.py
 Central place for alarm filtering policy.
 Return True  -> DROP alarm
 Return False -> KEEP alarm
-"""
-
-from datetime import datetime, timedelta
-
-
-# =================================================
-# Helpers
-# =================================================
-def _parse_time(ts):
-    return datetime.fromisoformat(ts.replace("Z", "+00:00"))
-
 
-def _extract_ops_span(name):
-    """
-    Extract OPS shelf/slot span.
-    Example:
-      Benapole/OPS-3-7-A3,OCH,RCV  -> OPS-3-7
-      Jessore/OPS-3-3-SIG2,OCH    -> OPS-3-3
-    """
-    if not name:
-        return None
-
-    for part in name.split("/"):
-        if part.startswith("OPS-"):
-            return "-".join(part.split("-")[:3])
-    return None
-
-
-# =================================================
-# POWER correlation
-# =================================================
-POWER_CHILD_ALARMS = {
-    "Power Adjustment Required",
-    "Power Adjustment Failure",
-}
-
-POWER_TIME_WINDOW = timedelta(minutes=10)
-
-
-# =================================================
-# LOS-OCH correlation
-# =================================================
-LOS_ROOT_ALARMS = {
-    "Loss of signal - OCH",
-}
-
-LOS_CHILD_ALARMS = {
-    "Transport Failure",
-    "OPS Protection Loss of Redundancy",
-}
+Keep rules live here; root/child correlation is declared in
+correlation_rules.json (see correlation_rules.py) and the plain drop
+rules in filter_rules.json (see filter_rules.py).
+"""
 
-LOS_TIME_WINDOW = timedelta(seconds=30)
+from filter_rules import get_rules
+from correlation_rules import get_correlation_rules
 
 
 # =================================================
 # MAIN FILTER FUNCTION
 # =================================================
-def should_drop_alarm(
+def drop_reason(
     *,
     alarm_name,
     specific_problem,
@@ -72,146 +28,63 @@ def should_drop_alarm(
     object_type,
     severity,
     affected_object_name=None,
+    affected_object=None,
     first_detected=None,
-    active_power_issues=None,
-    active_los_alarms=None,
+    correlation_index=None,
 ):
     """
-    Decide whether an alarm should be dropped.
-    Return True  -> DROP
-    Return False -> KEEP
+    Decide whether an alarm should be dropped, and why.
+    Return rule name -> DROP
+    Return None      -> KEEP
+
+    first_detected:    epoch milliseconds (int)
+    correlation_index: active root alarm index
+    (see active_alarm_index.ActiveAlarmIndex)
     """
 
     # -------------------------------
     # Always keep cleared alarms
     # -------------------------------
     if severity == "CLEAR":
-        return False
+        return None
+
+    fields = {
+        "alarm_name": alarm_name,
+        "specific_problem": specific_problem,
+        "probable_cause": probable_cause,
+        "ne_name": ne_name,
+        "ne_id": ne_id,
+        "source": source,
+        "object_type": object_type,
+        "severity": severity,
+        "affected_object_name": affected_object_name,
+        "affected_object": affected_object,
+    }
 
     # -------------------------------
-    # MASTER: Always KEEP Power Issue
+    # MASTER: Always KEEP keep_root roots (Power Issue)
     # -------------------------------
-    if alarm_name == "Power Issue" and object_type == "PHYSICALCONNECTION":
-        return False
-
-    # =================================================
-    # 🔥 POWER CHILD SUPPRESSION
-    # =================================================
-    if (
-        alarm_name in POWER_CHILD_ALARMS
-        and object_type == "TP"
-        and active_power_issues
-        and affected_object_name
-        and first_detected
-    ):
-        child_time = _parse_time(first_detected)
-        child_span = _extract_ops_span(affected_object_name)
-
-        for pi in active_power_issues:
-            pi_time = pi.get("first_detected")
-            pi_obj = pi.get("affected_object_name")
-
-            if not pi_time or not pi_obj:
-                continue
-
-            if abs(child_time - _parse_time(pi_time)) > POWER_TIME_WINDOW:
-                continue
-
-            if child_span and child_span == _extract_ops_span(pi_obj):
-                return True   # DROP power child
+    if get_correlation_rules().keeps(fields):
+        return None
 
     # =================================================
-    # 🔥 LOS-OCH CORRELATION (ROOT / CHILD)
+    # 🔥 ROOT / CHILD CORRELATION (correlation_rules.json)
     # =================================================
-    if (
-        alarm_name in LOS_CHILD_ALARMS
-        and active_los_alarms
-        and first_detected
-    ):
-        child_time = _parse_time(first_detected)
-        child_span = _extract_ops_span(affected_object_name)
-
-        for los in active_los_alarms:
-            if (
-                los.get("alarm_name") not in LOS_ROOT_ALARMS
-                or los.get("severity") != "CRITICAL"
-                or not los.get("first_detected")
-            ):
-                continue
-
-            los_time = _parse_time(los["first_detected"])
-
-            # ⏱ Time correlation
-            if abs(child_time - los_time) > LOS_TIME_WINDOW:
-                continue
-
-            los_span = _extract_ops_span(los.get("affected_object_name"))
-
-            # 🎯 Correlation priority:
-            # 1. OPS span match (best)
-            # 2. Same NE (fallback, mainly for TRAIL)
-            if (
-                (child_span and los_span and child_span == los_span)
-                or ne_name == los.get("ne_name")
-            ):
-                return True   # DROP LOS child
+    if correlation_index is not None and first_detected is not None:
+        rule = correlation_index.correlated_rule(fields, first_detected)
+        if rule:
+            return rule   # DROP child of an active root
 
     # =================================================
-    # EXISTING FILTER LOGIC (UNCHANGED)
+    # DECLARED DROP RULES (filter_rules.json)
     # =================================================
-    if (
-        (
-            isinstance(object_type, str)
-            and object_type.startswith("NE")
-            and "CLI" in object_type
-            and object_type.endswith(("Login", "Logout"))
-        )
+    return get_rules().match(fields)
 
-        or (
-            isinstance(probable_cause, str)
-            and probable_cause.startswith("NE")
-            and probable_cause.endswith(("Login", "Logout"))
-        )
 
-        or (
-            isinstance(alarm_name, str)
-            and object_type.startswith("Indicates")
-            and "Threshold" in object_type
-            and object_type.endswith("detection")
-        )
-
-        or (
-            isinstance(alarm_name, str)
-            and object_type.startswith("Power")
-            and "management" in object_type
-            and object_type.endswith("suspended")
-        )
-
-        or alarm_name == "SR_RESTORED"
-        or alarm_name == "SR_MANUAL_SWITCH"
-        or alarm_name == "BASELINE"
-
-        or alarm_name == "Adjacency Not Found"
-
-        or specific_problem == "SEC_NA"
-        or probable_cause in ("OPR", "PWRSUSP")
-
-        or (
-            isinstance(probable_cause, str)
-            and probable_cause.startswith("T-")
-            and probable_cause.endswith(("15-MIN", "1-DAY"))
-        )
-
-        or (
-            isinstance(alarm_name, str)
-            and alarm_name.startswith("Quality Threshold Crossed")
-            and alarm_name.endswith(("15m", "24h"))
-        )
-
-        or probable_cause == "MAINT2-ALLOWED-REMOTE"
-
-        or severity in ("WARNING", "INFO")
-    ):
-        return True
-
-    return False
+def should_drop_alarm(**fields):
+    """
+    Return True  -> DROP
+    Return False -> KEEP
+    (see drop_reason for the arguments)
+    """
+    return drop_reason(**fields) is not None
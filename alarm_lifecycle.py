@@ -1,32 +1,12 @@
-import psycopg2
-import json
-from contextlib import contextmanager
+from psycopg2.extras import execute_values
 
-# -------------------------------
-# Database configuration
-# -------------------------------
-DB_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 5432,
-    "dbname": "nsp",
-    "user": "nsp_user",
-    "password": "nsp_pass",
-}
-
-# -------------------------------
-# Connection helper
-# -------------------------------
-@contextmanager
-def get_conn():
-    conn = psycopg2.connect(**DB_CONFIG)
-    try:
-        yield conn
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+from codec import encode
+from db_pool import get_conn
+from active_alarm_index import active_index, active_children
+from alarm_dedup import content_hash, written_hashes
+from metrics import UPSERTS_SKIPPED, DROPS, CHILDREN_RETRACTED
+from offset_store import write_offsets
+from time_utils import iso_to_epoch_ms
 
 # -------------------------------
 # SQL
@@ -37,28 +17,151 @@ VALUES (%s, %s::jsonb)
 ON CONFLICT (alarm_id)
 DO UPDATE SET
     alarm = EXCLUDED.alarm,
-    last_updated = now();
+    last_updated = now()
+WHERE active_alarms.alarm IS DISTINCT FROM EXCLUDED.alarm;
 """
 
-DELETE_ACTIVE_SQL = """
-DELETE FROM active_alarms
-WHERE alarm_id = %s
+# CLEAR: move the stored row to history without leaving Postgres
+MOVE_CLEARED_SQL = """
+WITH moved AS (
+    DELETE FROM active_alarms
+    WHERE alarm_id = %s
+    RETURNING alarm_id, alarm
+)
+INSERT INTO alarm_history (alarm_id, alarm, cleared_at)
+SELECT alarm_id, alarm, now()
+FROM moved
+WHERE alarm IS NOT NULL;
+"""
+
+# Non-CLEAR alarm-change: merge only the changed keys into the stored
+# document. Rows that already contain every new value are not rewritten.
+MERGE_CHANGE_SQL = """
+UPDATE active_alarms
+SET alarm = alarm || %(changes)s::jsonb,
+    last_updated = now()
+WHERE alarm_id = %(alarm_id)s
+  AND NOT alarm @> %(changes)s::jsonb
 RETURNING alarm;
 """
 
-INSERT_HISTORY_SQL = """
+# Stored children whose root arrived after them: gone, not cleared,
+# so they are not archived to alarm_history
+RETRACT_CHILDREN_SQL = """
+DELETE FROM active_alarms
+WHERE alarm_id = ANY(%s);
+"""
+
+# Batch variants (psycopg2 execute_values expands the single VALUES %s)
+UPSERT_ACTIVE_BATCH_SQL = """
+INSERT INTO active_alarms (alarm_id, alarm)
+VALUES %s
+ON CONFLICT (alarm_id)
+DO UPDATE SET
+    alarm = EXCLUDED.alarm,
+    last_updated = now()
+WHERE active_alarms.alarm IS DISTINCT FROM EXCLUDED.alarm;
+"""
+
+MERGE_CHANGES_BATCH_SQL = """
+UPDATE active_alarms a
+SET alarm = a.alarm || c.changes,
+    last_updated = now()
+FROM (VALUES %s) AS c (alarm_id, changes)
+WHERE a.alarm_id = c.alarm_id
+  AND NOT a.alarm @> c.changes
+RETURNING a.alarm;
+"""
+
+# alarm is NULL when the stored active row should be archived as-is,
+# or the batch's own copy when the alarm was raised within the batch.
+# An alarm_id may appear twice (CLEAR -> create -> CLEAR): the stored
+# row is deleted once and both copies are archived, `seq` microseconds
+# apart, since (alarm_id, cleared_at) is alarm_history's primary key.
+MOVE_CLEARED_BATCH_SQL = """
+WITH cleared (alarm_id, alarm, seq) AS (
+    VALUES %s
+),
+moved AS (
+    DELETE FROM active_alarms a
+    USING cleared c
+    WHERE a.alarm_id = c.alarm_id
+    RETURNING a.alarm_id, a.alarm
+)
 INSERT INTO alarm_history (alarm_id, alarm, cleared_at)
-VALUES (%s, %s::jsonb, now());
+SELECT c.alarm_id, COALESCE(c.alarm, m.alarm), now() + c.seq * interval '1 microsecond'
+FROM cleared c
+LEFT JOIN moved m ON m.alarm_id = c.alarm_id
+WHERE COALESCE(c.alarm, m.alarm) IS NOT NULL;
 """
 
+# -------------------------------
+# Correlation index upkeep
+# -------------------------------
+def _track(alarm):
+    active_index.upsert(alarm)
+    active_children.upsert(alarm)
+
+
+def _untrack(alarm_id):
+    active_index.remove(alarm_id)
+    active_children.remove(alarm_id)
+
+
+def correlated_children(roots):
+    """
+    {alarm_id: rule} of the stored children of `roots`, i.e. children
+    that were written before their root arrived.
+    """
+    retract = {}
+    for root in roots:
+        ts = iso_to_epoch_ms(root.get("first_detected"))
+        if ts is None:
+            continue
+        for rule, alarm_id in active_children.correlated(root, ts):
+            retract.setdefault(alarm_id, rule)
+    return retract
+
+
+def late_child_rule(alarm):
+    """
+    Rule under which a create that drop_reason kept is, by now, the
+    child of an indexed root (the root arrived after it); else None.
+    """
+    rules = active_index.rules
+    if alarm.get("severity") == "CLEAR" or not rules.child_rules(alarm) or rules.keeps(alarm):
+        return None
+
+    ts = iso_to_epoch_ms(alarm.get("first_detected"))
+    return active_index.correlated_rule(alarm, ts) if ts is not None else None
+
+
+def _retracted(retract):
+    for alarm_id, rule in retract.items():
+        _untrack(alarm_id)
+        written_hashes.forget(alarm_id)
+        CHILDREN_RETRACTED.labels(rule).inc()
+
+
 # -------------------------------
 # Lifecycle handler
 # -------------------------------
-def handle_alarm_lifecycle(alarm: dict):
+def handle_alarm_lifecycle(alarm: dict, payload=None, offsets=None):
     """
     alarm-create         -> active_alarms
     alarm-change + CLEAR -> history
+    alarm-change         -> changed keys merged into active_alarms
     alarm-delete         -> ignored
+
+    A root create also deletes the stored children it correlates with
+    (children written before their root arrived).
+
+    `payload` is the alarm already encoded by codec.encode(), so callers
+    that also log the alarm serialize it only once.
+    `offsets` ({(topic, partition): next_offset}) are stored in the same
+    transaction as the write.
+    The in-memory correlation index is updated after the DB commit.
+    Returns True if a transaction was committed (offsets included).
     """
 
     alarm_id = alarm.get("alarm_id")
@@ -66,65 +169,283 @@ def handle_alarm_lifecycle(alarm: dict):
     severity = alarm.get("severity")
 
     if not alarm_id or not event_type:
-        return
+        return False
 
     if event_type == "alarm-delete":
-        return
+        return False
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
+    if event_type == "alarm-change" and severity == "CLEAR":
+        written_hashes.forget(alarm_id)
 
-            if event_type == "alarm-change" and severity == "CLEAR":
-                cur.execute(DELETE_ACTIVE_SQL, (alarm_id,))
-                row = cur.fetchone()
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(MOVE_CLEARED_SQL, (alarm_id,))
+            if offsets:
+                write_offsets(cur, offsets)
 
-                if row and row[0]:
-                    cur.execute(
-                        INSERT_HISTORY_SQL,
-                        (alarm_id, json.dumps(row[0], default=str)),
-                    )
-                return
+        _untrack(alarm_id)
+        return True
 
-            if event_type != "alarm-create":
-                return
+    if event_type == "alarm-change":
+        changes = alarm.get("changes")
+        if not changes:
+            return False
 
-            if not alarm.get("alarm_name") or not alarm.get("ne_name"):
-                return
+        written_hashes.forget(alarm_id)
 
+        with get_conn() as conn, conn.cursor() as cur:
             cur.execute(
-                UPSERT_ACTIVE_SQL,
-                (alarm_id, json.dumps(alarm, default=str)),
+                MERGE_CHANGE_SQL,
+                {"alarm_id": alarm_id, "changes": encode(changes)},
             )
+            row = cur.fetchone()
+            if offsets:
+                write_offsets(cur, offsets)
+
+        # No row: not stored (dropped on create) or nothing changed
+        if row:
+            _track(row[0])
+        return True
+
+    if event_type != "alarm-create":
+        return False
+
+    if not alarm.get("alarm_name") or not alarm.get("ne_name"):
+        return False
+
+    # Re-sent create of an alarm we already wrote unchanged
+    digest = content_hash(alarm)
+    if written_hashes.unchanged(alarm_id, digest):
+        UPSERTS_SKIPPED.inc()
+        return False
+
+    retract = correlated_children([alarm])
+
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            UPSERT_ACTIVE_SQL,
+            (alarm_id, payload or encode(alarm)),
+        )
+        if retract:
+            cur.execute(RETRACT_CHILDREN_SQL, (list(retract),))
+        if offsets:
+            write_offsets(cur, offsets)
+
+    written_hashes.record(alarm_id, digest)
+    _track(alarm)
+    _retracted(retract)
+    return True
 
 # -------------------------------
-# Power Issue state helper
+# Batch lifecycle handler
 # -------------------------------
-def get_active_power_issues():
+def _is_clear(alarm):
+    return alarm.get("event_type") == "alarm-change" and alarm.get("severity") == "CLEAR"
+
+
+def _is_storable_create(alarm):
+    return (
+        alarm.get("event_type") == "alarm-create"
+        and alarm.get("alarm_name")
+        and alarm.get("ne_name")
+    )
+
+
+def _is_change(alarm):
+    return alarm.get("event_type") == "alarm-change" and alarm.get("changes")
+
+
+def collapse_alarm_events(alarms):
+    """
+    Collapse an ordered list of normalized alarms into the net effect
+    per alarm_id, following the same rules as handle_alarm_lifecycle.
+
+    Returns (upserts, changes, clears):
+      upserts -> {alarm_id: alarm} to write to active_alarms
+      changes -> {alarm_id: changed keys} to merge into stored rows
+      clears  -> {alarm_id: [alarm | None, ...]} copies to move to history,
+                 in order (None = whatever is stored in active_alarms)
+    """
+    upserts = {}
+    changes = {}
+    clears = {}
+
+    for alarm in alarms:
+        alarm_id = alarm.get("alarm_id")
+        if not alarm_id:
+            continue
+
+        if _is_clear(alarm):
+            # A create earlier in this batch supersedes the stored row;
+            # a CLEAR before that create still archives the stored row
+            archived = clears.setdefault(alarm_id, [])
+            created = upserts.pop(alarm_id, None)
+            if created is not None:
+                archived.append(created)
+            elif not archived:
+                archived.append(None)
+        elif _is_storable_create(alarm):
+            upserts[alarm_id] = alarm
+        elif _is_change(alarm):
+            if alarm_id in upserts:
+                # Raised within this batch: merge into the document to write
+                upserts[alarm_id] = {**upserts[alarm_id], **alarm["changes"]}
+            elif alarm_id not in clears:
+                changes[alarm_id] = {**changes.get(alarm_id, {}), **alarm["changes"]}
+
+    return upserts, changes, clears
+
+
+def handle_alarm_batch(alarms, offsets=None):
     """
-    Fetch currently active Power Issue alarms.
+    Apply a batch of normalized alarms in ONE transaction:
+      - all changes with one UPDATE ... SET alarm = alarm || changes
+      - all CLEAR moves with one set-based DELETE ... RETURNING -> INSERT
+      - all upserts with one multi-row INSERT ... ON CONFLICT
+
+    Changes go first, so a cleared alarm is archived with its latest
+    values. Clears are applied before upserts, so an alarm cleared and
+    re-raised within the batch ends up both in history and active again.
+
+    Children whose root arrived later in the batch (or while they were
+    held) are not written; stored children of the batch's roots are
+    deleted with one DELETE ... WHERE alarm_id = ANY(...).
+    `offsets` are stored in the same transaction, if there is one.
+    The in-memory correlation index is updated after the DB commit.
+    Returns the number of alarm writes (0 = no transaction).
     """
+    upserts, changes, clears = collapse_alarm_events(alarms)
+
+    # Deleted too, in case an earlier create of the child was stored
+    late = {}
+    for alarm_id, alarm in list(upserts.items()):
+        rule = late_child_rule(alarm)
+        if rule:
+            del upserts[alarm_id]
+            late[alarm_id] = rule
+            DROPS.labels(rule).inc()
+
+    # Before the dedup check: a re-raise after a CLEAR (or a change) in
+    # this batch must be written even if it matches the last write
+    for alarm_id in list(changes) + list(clears):
+        written_hashes.forget(alarm_id)
+
+    # Skip re-sent creates of alarms already written unchanged
+    digests = {}
+    for alarm_id, alarm in list(upserts.items()):
+        digest = content_hash(alarm)
+        if written_hashes.unchanged(alarm_id, digest):
+            del upserts[alarm_id]
+            UPSERTS_SKIPPED.inc()
+        else:
+            digests[alarm_id] = digest
+
+    retract = correlated_children(upserts.values())
+    retract_ids = list({**late, **retract})
+
+    if not upserts and not changes and not clears and not retract_ids:
+        return 0
+
+    changed = []
+
+    with get_conn() as conn, conn.cursor() as cur:
+        if changes:
+            changed = execute_values(
+                cur,
+                MERGE_CHANGES_BATCH_SQL,
+                [
+                    (alarm_id, encode(patch))
+                    for alarm_id, patch in changes.items()
+                ],
+                template="(%s, %s::jsonb)",
+                page_size=len(changes),
+                fetch=True,
+            )
+
+        if clears:
+            cleared = [
+                (alarm_id, encode(alarm) if alarm else None, seq)
+                for alarm_id, archived in clears.items()
+                for seq, alarm in enumerate(archived)
+            ]
+            execute_values(
+                cur,
+                MOVE_CLEARED_BATCH_SQL,
+                cleared,
+                template="(%s, %s::jsonb, %s)",
+                page_size=len(cleared),
+            )
+
+        if upserts:
+            execute_values(
+                cur,
+                UPSERT_ACTIVE_BATCH_SQL,
+                [
+                    (alarm_id, encode(alarm))
+                    for alarm_id, alarm in upserts.items()
+                ],
+                template="(%s, %s::jsonb)",
+                page_size=len(upserts),
+            )
+
+        if retract_ids:
+            cur.execute(RETRACT_CHILDREN_SQL, (retract_ids,))
+
+        if offsets:
+            write_offsets(cur, offsets)
+
+    for (alarm,) in changed:
+        _track(alarm)
+    for alarm_id in clears:
+        _untrack(alarm_id)
+    for alarm_id, alarm in upserts.items():
+        written_hashes.record(alarm_id, digests[alarm_id])
+        _track(alarm)
+    for alarm_id in late:
+        _untrack(alarm_id)
+        written_hashes.forget(alarm_id)
+    _retracted(retract)
+
+    return len(upserts) + len(changes) + len(clears) + len(retract_ids)
+
+# -------------------------------
+# Root / child alarm state helpers
+# -------------------------------
+def _get_active_alarms(alarm_names, selected):
     sql = """
     SELECT alarm
     FROM active_alarms
-    WHERE alarm->>'alarm_name' = 'Power Issue'
-      AND alarm->>'object_type' = 'PHYSICALCONNECTION';
+    WHERE alarm_name = ANY(%s);
     """
 
     with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(sql)
-        return [row[0] for row in cur.fetchall()]
+        cur.execute(sql, (alarm_names,))
+        return [row[0] for row in cur.fetchall() if selected(row[0])]
+
 
-def get_active_los_alarms():
+def get_active_root_alarms():
     """
-    Fetch currently active Loss of signal - OCH alarms.
+    Fetch currently active alarms that are roots of a correlation rule.
     """
-    sql = """
-    SELECT alarm
-    FROM active_alarms
-    WHERE alarm->>'alarm_name' = 'Loss of signal - OCH'
-      AND alarm->>'severity' IN ('CRITICAL', 'MAJOR');
+    rules = active_index.rules
+    return _get_active_alarms(rules.root_names, rules.is_root)
+
+
+def get_active_child_alarms():
+    """
+    Fetch currently active alarms that are children of a correlation rule.
     """
+    rules = active_index.rules
+    return _get_active_alarms(rules.child_names, rules.child_rules)
 
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(sql)
-        return [row[0] for row in cur.fetchall()]
\ No newline at end of file
+
+# -------------------------------
+# Correlation index warm-up
+# -------------------------------
+def warm_active_index():
+    """
+    Load active root (and child) alarms into the in-memory correlation
+    indexes. Called once at consumer startup. Returns the root count.
+    """
+    active_index.warm(get_active_root_alarms())
+    active_children.warm(get_active_child_alarms())
+    return len(active_index)
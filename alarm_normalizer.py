@@ -1,90 +1,121 @@
-from datetime import datetime, timezone, timedelta
-import pytz
-from datetime import datetime
+import time
 from severity_mapper import map_severity
 from object_parser import parse_affected_object
-from alarm_filters import should_drop_alarm
-from alarm_lifecycle import get_active_power_issues
-from alarm_lifecycle import get_active_los_alarms
+from alarm_filters import drop_reason
+from metrics import DROPS, STAGE_LATENCY
+from active_alarm_index import active_index
+from time_utils import epoch_ms, format_local_iso
 
 
 # -------------------------------
 # Time conversion
 # -------------------------------
-LOCAL_TZ = pytz.timezone("Asia/Dhaka")
-
 def utc_ms_to_local_iso(ts):
     """Convert epoch ms → ISO string in Asia/Dhaka (+6) timezone."""
-    if ts is None:
-        return None
+    return format_local_iso(epoch_ms(ts))
 
-    if isinstance(ts, dict):
-        ts = (
-            ts.get("value")
-            or ts.get("milliseconds")
-            or (ts.get("seconds", 0) * 1000)
-        )
 
-    if isinstance(ts, str):
-        if not ts.isdigit():
-            return None
-        ts = int(ts)
+def unwrap_notification(event):
+    """
+    Return (notification, event_type, raw_alarm) from an NSP event.
+    """
+    notif = event.get("data", {}).get("ietf-restconf:notification", {})
 
-    if not isinstance(ts, (int, float)):
-        return None
+    for k, v in notif.items():
+        if k.startswith("nsp-fault:"):
+            return notif, k.replace("nsp-fault:", ""), v
 
-    try:
-        utc_dt = datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
-        local_dt = utc_dt.astimezone(LOCAL_TZ)
-        return local_dt.isoformat()  # e.g. 2026-01-23T17:05:10+06:00
-    except Exception:
-        return None
+    return notif, None, None
 
 
-def epoch_ms_to_utc(ts):
-    if ts is None:
-        return None
+def event_alarm_id(event):
+    """
+    Alarm objectId of a raw NSP event (without normalizing it).
+    """
+    _, _, alarm = unwrap_notification(event)
+    if isinstance(alarm, dict):
+        return alarm.get("objectId")
+    return None
 
-    if isinstance(ts, dict):
-        ts = (
-            ts.get("value")
-            or ts.get("milliseconds")
-            or (ts.get("seconds", 0) * 1000)
-        )
 
-    if isinstance(ts, str):
-        if not ts.isdigit():
-            return None
-        ts = int(ts)
+# -------------------------------
+# alarm-change (partial update)
+# -------------------------------
+def _new_value(value):
+    """alarm-change attributes arrive as {"old-value": .., "new-value": ..}."""
+    if isinstance(value, dict) and "new-value" in value:
+        return value["new-value"]
+    return value
 
-    if not isinstance(ts, (int, float)):
-        return None
 
-    try:
-        return datetime.utcfromtimestamp(ts / 1000).isoformat() + "Z"
-    except Exception:
+def _copy(value):
+    return value
+
+
+def _time(value):
+    return utc_ms_to_local_iso(value)
+
+
+# NSP attribute -> (stored key, converter). Only these are material:
+# a change touching nothing else is not written at all.
+CHANGE_FIELDS = {
+    "alarmName": ("alarm_name", _copy),
+    "specificProblem": ("specific_problem", _copy),
+    "probableCause": ("probable_cause", _copy),
+    "affectedObjectName": ("affected_object_name", _copy),
+    "firstTimeDetected": ("first_detected", _time),
+    "lastTimeDetected": ("last_detected", _time),
+    "acknowledged": ("acknowledged", _copy),
+    "serviceAffecting": ("service_affecting", _copy),
+    "implicitlyCleared": ("implicitly_cleared", _copy),
+}
+
+
+def normalize_change(notif, alarm):
+    """
+    Non-CLEAR alarm-change -> {"event_type", "event_time", "alarm_id", "changes"}
+    where `changes` holds only the stored keys that changed (new values).
+
+    Changes are not run through the drop rules: the policy decision was
+    made on alarm-create, and a change for an alarm that was dropped
+    simply matches no stored row.
+    """
+    changes = {}
+
+    for nsp_key, (key, convert) in CHANGE_FIELDS.items():
+        if nsp_key in alarm:
+            changes[key] = convert(_new_value(alarm[nsp_key]))
+
+    if "severity" in alarm:
+        severity_raw = _new_value(alarm["severity"])
+        changes["severity_raw"] = severity_raw
+        changes["severity"] = map_severity(severity_raw, None)
+
+    if not changes:
+        DROPS.labels("immaterial_change").inc()
         return None
 
+    return {
+        "event_type": "alarm-change",
+        "event_time": notif.get("eventTime"),
+        "alarm_id": alarm.get("objectId"),
+        "changes": changes,
+    }
+
 
 def normalize_alarm(event):
     """
     Normalize Nokia NSP/NFMT alarm notification.
     """
 
-    notif = event.get("data", {}).get("ietf-restconf:notification", {})
-
-    alarm = None
-    event_type = None
-
-    for k, v in notif.items():
-        if k.startswith("nsp-fault:"):
-            event_type = k.replace("nsp-fault:", "")
-            alarm = v
-            break
+    notif, event_type, alarm = unwrap_notification(event)
 
     if not alarm or not isinstance(alarm, dict):
         return None
 
+    if event_type == "alarm-change" and map_severity(alarm.get("severity"), None) != "CLEAR":
+        return normalize_change(notif, alarm)
+
     alarm_name = alarm.get("alarmName")
     specific_problem = alarm.get("specificProblem")
     probable_cause = alarm.get("probableCause")
@@ -96,13 +127,11 @@ def normalize_alarm(event):
     severity_raw = alarm.get("severity")
     severity = map_severity(severity_raw, specific_problem)
 
-    # 🔑 Fetch correlation context BEFORE filtering
-    active_power_issues = get_active_power_issues()
+    # Epoch ms internally; ISO only for the stored document
+    first_detected_ms = epoch_ms(alarm.get("firstTimeDetected"))
 
-    # new helper for LOS-OCH correlation
-    active_los_alarms = get_active_los_alarms()
-
-    if should_drop_alarm(
+    started = time.perf_counter()
+    reason = drop_reason(
         alarm_name=alarm_name,
         specific_problem=specific_problem,
         probable_cause=probable_cause,
@@ -112,10 +141,15 @@ def normalize_alarm(event):
         object_type=object_type,
         severity=severity,
         affected_object_name=alarm.get("affectedObjectName"),
-        first_detected=epoch_ms_to_utc(alarm.get("firstTimeDetected")),
-        active_power_issues=active_power_issues,
-        active_los_alarms=active_los_alarms,  # ✅ ADD THIS LINE
-    ):
+        affected_object=alarm.get("affectedObject"),
+        first_detected=first_detected_ms,
+        # 🔑 Correlation context from the in-memory index (no DB query)
+        correlation_index=active_index,
+    )
+    STAGE_LATENCY.labels("filter").observe(time.perf_counter() - started)
+
+    if reason:
+        DROPS.labels(reason).inc()
         return None
     
     
@@ -143,9 +177,7 @@ def normalize_alarm(event):
             alarm.get("affectedObject")
         ),
 
-        "first_detected": utc_ms_to_local_iso(
-            alarm.get("firstTimeDetected")
-        ),
+        "first_detected": format_local_iso(first_detected_ms),
         "last_detected": utc_ms_to_local_iso(
             alarm.get("lastTimeDetected")
         ),
@@ -0,0 +1,237 @@
+"""
+alarm_resync.py
+
+Startup resync of active_alarms against NSP's current alarm list.
+
+Events are only received while subscribed, so clears (and raises) that
+happened while the consumer was down never reach active_alarms. Before
+consuming, the full alarm list is paged over REST, normalized with the
+same rules as live events, and applied as ONE set-based diff:
+
+  1. COPY the snapshot into a temp table
+  2. move stored alarms missing from the snapshot to alarm_history
+  3. merge changed alarms (alarm || snapshot, like alarm-change)
+  4. insert alarms we do not have yet
+
+The snapshot is fetched completely before anything is written; a
+failed or unrecognized fetch leaves active_alarms untouched.
+"""
+
+import io
+import logging
+import time
+from argparse import ArgumentParser
+
+from configuration import ALARM_LIST_URL, RESYNC_PAGE_SIZE
+from alarm_normalizer import normalize_alarm
+from active_alarm_index import active_index, is_root
+from codec import encode
+from db_pool import get_conn
+from time_utils import epoch_ms
+from http_session import request
+
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# SQL
+# -------------------------------
+CREATE_SNAPSHOT_SQL = """
+CREATE TEMP TABLE alarm_snapshot (
+    alarm_id TEXT PRIMARY KEY,
+    alarm JSONB NOT NULL
+) ON COMMIT DROP;
+"""
+
+COPY_SNAPSHOT_SQL = "COPY alarm_snapshot (alarm_id, alarm) FROM STDIN;"
+
+MOVE_MISSING_SQL = """
+WITH moved AS (
+    DELETE FROM active_alarms a
+    WHERE NOT EXISTS (
+        SELECT 1 FROM alarm_snapshot s WHERE s.alarm_id = a.alarm_id
+    )
+    RETURNING a.alarm_id, a.alarm
+)
+INSERT INTO alarm_history (alarm_id, alarm, cleared_at)
+SELECT alarm_id, alarm, now()
+FROM moved
+WHERE alarm IS NOT NULL;
+"""
+
+# Snapshot documents carry no event_time / flap_count; the stored ones keep theirs
+MERGE_CHANGED_SQL = """
+UPDATE active_alarms a
+SET alarm = a.alarm || s.alarm,
+    last_updated = now()
+FROM alarm_snapshot s
+WHERE a.alarm_id = s.alarm_id
+  AND NOT a.alarm @> s.alarm;
+"""
+
+INSERT_NEW_SQL = """
+INSERT INTO active_alarms (alarm_id, alarm)
+SELECT alarm_id, alarm
+FROM alarm_snapshot
+ON CONFLICT (alarm_id) DO NOTHING;
+"""
+
+
+# -------------------------------
+# Fetch (REST, paged)
+# -------------------------------
+def page_alarms(body):
+    """
+    Alarm objects of one RESTCONF alarm-list page, or None if the
+    response does not look like an alarm list.
+    """
+    data = body.get("nsp-fault:alarm-list", body)
+    alarms = data.get("alarm", data.get("nsp-fault:alarm"))
+    return alarms if isinstance(alarms, list) else None
+
+
+def fetch_alarm_list(token_mgr, page_size=RESYNC_PAGE_SIZE):
+    """
+    Page through NSP's current alarm list. Returns the raw alarm objects.
+    """
+    alarms = []
+    offset = 0
+
+    while True:
+        response = request(
+            "GET",
+            ALARM_LIST_URL,
+            headers={
+                "Authorization": f"Bearer {token_mgr.get_access_token()}",
+                "Accept": "application/json",
+            },
+            params={"offset": offset, "limit": page_size},
+        )
+        response.raise_for_status()
+
+        page = page_alarms(response.json()) if response.content else []
+        if page is None:
+            if offset == 0:
+                raise ValueError("❌ Unrecognized alarm list response")
+            break
+
+        alarms.extend(page)
+        if len(page) < page_size:
+            break
+        offset += len(page)
+
+    return alarms
+
+
+# -------------------------------
+# Normalize
+# -------------------------------
+def _replay_order(raw):
+    """
+    Roots first, then everything by first detection time, so correlation
+    sees every root and its watermark advances as it does live.
+    """
+    is_root_name = raw.get("alarmName") in active_index.rules.root_names
+    return (not is_root_name, epoch_ms(raw.get("firstTimeDetected")) or 0)
+
+
+def normalize_snapshot(raw_alarms):
+    """
+    Raw NSP alarms -> {alarm_id: stored document} for every alarm the
+    live pipeline would keep, regardless of the order NSP lists them in.
+    """
+    snapshot = {}
+
+    for raw in sorted(raw_alarms, key=_replay_order):
+        event = {"data": {"ietf-restconf:notification": {"nsp-fault:alarm-create": raw}}}
+        alarm = normalize_alarm(event)
+
+        if not alarm or alarm["severity"] == "CLEAR":
+            continue
+        if not alarm.get("alarm_id") or not alarm.get("alarm_name") or not alarm.get("ne_name"):
+            continue
+
+        del alarm["event_time"]
+        snapshot[alarm["alarm_id"]] = alarm
+
+        if is_root(alarm):
+            active_index.upsert(alarm)
+
+    return snapshot
+
+
+# -------------------------------
+# Apply (set-based diff)
+# -------------------------------
+def _copy_text(value):
+    """Escape a value for COPY ... FROM STDIN (text format)."""
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def apply_snapshot(snapshot, dry_run=False):
+    """
+    Diff active_alarms against `snapshot` in one transaction.
+    Returns (moved, updated, inserted); dry_run rolls everything back.
+    """
+    buf = io.StringIO()
+    for alarm_id, alarm in snapshot.items():
+        buf.write(f"{_copy_text(alarm_id)}\t{_copy_text(encode(alarm))}\n")
+    buf.seek(0)
+
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(CREATE_SNAPSHOT_SQL)
+        cur.copy_expert(COPY_SNAPSHOT_SQL, buf)
+
+        cur.execute(MOVE_MISSING_SQL)
+        moved = cur.rowcount
+        cur.execute(MERGE_CHANGED_SQL)
+        updated = cur.rowcount
+        cur.execute(INSERT_NEW_SQL)
+        inserted = cur.rowcount
+
+        if dry_run:
+            conn.rollback()
+
+    return moved, updated, inserted
+
+
+def resync_active_alarms(token_mgr, dry_run=False):
+    started = time.monotonic()
+
+    raw_alarms = fetch_alarm_list(token_mgr)
+    snapshot = normalize_snapshot(raw_alarms)
+    moved, updated, inserted = apply_snapshot(snapshot, dry_run)
+
+    log.info(
+        "🔄 Active alarms resynced" if not dry_run else "🧪 Resync dry run (rolled back)",
+        extra={
+            "nsp_alarms": len(raw_alarms),
+            "kept": len(snapshot),
+            "moved_to_history": moved,
+            "updated": updated,
+            "inserted": inserted,
+            "elapsed_ms": round((time.monotonic() - started) * 1000),
+        },
+    )
+    return moved, updated, inserted
+
+
+def main():
+    from configuration import USERNAME, PASSWORD
+    from token_manager_automatic_refresh import TokenManager
+    from structured_logging import setup_logging
+
+    parser = ArgumentParser("Resync active_alarms with NSP's current alarm list")
+    parser.add_argument("--dry-run", action="store_true", help="Compute the diff, then roll it back")
+    args = parser.parse_args()
+
+    setup_logging()
+    resync_active_alarms(TokenManager(USERNAME, PASSWORD), args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
+import csv
 import psycopg2
 import json
+import sys
+from datetime import datetime
 from tabulate import tabulate
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
+
+from codec import dumps
 
 # -------------------------------
 # Database configuration
@@ -21,33 +26,102 @@ DB_CONFIG = {
 def get_conn():
     return psycopg2.connect(**DB_CONFIG)
 
+# -------------------------------
+# Paging / streaming
+# -------------------------------
+# Rows per round-trip of the server-side cursor
+FETCH_SIZE = 2000
+
+OUTPUT_FORMATS = ("table", "csv", "jsonl")
+
+
+def parse_after(value):
+    """
+    --after "<timestamp>,<alarm_id>" -> (timestamp, alarm_id)
+    """
+    ts, sep, alarm_id = value.partition(",")
+    if not sep or not ts or not alarm_id:
+        raise ArgumentTypeError("expected <timestamp>,<alarm_id>")
+    return ts.strip(), alarm_id.strip()
+
+
+def _cell(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_rows(sql, params, name):
+    """
+    Yield rows from a server-side (named) cursor, FETCH_SIZE at a time,
+    so memory stays flat however many rows match.
+    """
+    with get_conn() as conn:
+        with conn.cursor(name=name) as cur:
+            cur.itersize = FETCH_SIZE
+            cur.execute(sql, params)
+            for row in cur:
+                yield row
+
+
+def write_csv(rows, headers):
+    writer = csv.writer(sys.stdout)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow([_cell(v) for v in row])
+
+
+def write_jsonl(rows, keys):
+    """
+    One JSON object per row; the last column is the alarm document as
+    JSON text and is embedded as-is (no parse / re-serialize).
+    """
+    out = sys.stdout
+    for row in rows:
+        doc = dumps({k: _cell(v) for k, v in zip(keys, row)})
+        out.write(f'{doc[:-1]},"alarm":{row[-1]}}}\n' if row[-1] else doc + "\n")
+
+
+def print_next_page(rows, limit, order_index):
+    if not limit or len(rows) < limit:
+        return   # last page
+    last = rows[-1]
+    print(f"\n➡️  Next page: --after '{_cell(last[order_index])},{last[0]}'")
+
+
 # -------------------------------
 # SQL filter builder
 # -------------------------------
-def build_filters(severity, ne, from_time, to_time, time_field, correlated_only=False, include_root=True):
+def build_filters(severity, ne, from_time, to_time, time_field, correlated_only=False, include_root=True,
+                  after=None, order_field=None):
     clauses = []
     params = []
 
     if severity:
-        clauses.append("alarm->>'severity' = %s")
+        clauses.append("severity = %s")
         params.append(severity)
 
     if ne:
-        clauses.append("alarm->>'ne_name' ILIKE %s")
+        clauses.append("ne_name ILIKE %s")
         params.append(f"%{ne}%")
 
     if from_time:
-        clauses.append(f"{time_field} >= %s")
+        clauses.append(f"{time_field} >= %s::timestamptz")
         params.append(from_time)
 
     if to_time:
-        clauses.append(f"{time_field} <= %s")
+        clauses.append(f"{time_field} <= %s::timestamptz")
         params.append(to_time)
 
     if correlated_only:
-        clauses.append("alarm->>'alarm_name' IN ('Power Adjustment Required', 'Transport Failure', 'OPS Protection Loss of Redundancy')")
+        clauses.append("alarm_name IN ('Power Adjustment Required', 'Transport Failure', 'OPS Protection Loss of Redundancy')")
     elif not include_root:
-        clauses.append("alarm->>'alarm_name' NOT IN ('Power Issue', 'Loss of signal - OCH')")
+        clauses.append("alarm_name NOT IN ('Power Issue', 'Loss of signal - OCH')")
+
+    # Keyset pagination: rows strictly after the last one seen.
+    # The plain range predicate lets Postgres prune history partitions.
+    if after:
+        clauses.append(f"{order_field} <= %s::timestamptz")
+        clauses.append(f"({order_field}, alarm_id) < (%s::timestamptz, %s)")
+        params.extend((after[0],) + after)
 
     where_sql = ""
     if clauses:
@@ -58,95 +132,100 @@ def build_filters(severity, ne, from_time, to_time, time_field, correlated_only=
 # -------------------------------
 # ACTIVE alarms (list)
 # -------------------------------
-def show_active(limit, severity, ne, from_time, to_time, correlated_only, include_root):
+ACTIVE_HEADERS = ["Alarm ID", "Alarm Name", "NE", "Severity", "First Detected", "Last Detected", "Updated At"]
+ACTIVE_KEYS = ["alarm_id", "alarm_name", "ne_name", "severity", "first_detected", "last_detected", "last_updated"]
+
+
+def show_active(limit, severity, ne, from_time, to_time, correlated_only, include_root, after=None, fmt="table"):
     where_sql, params = build_filters(
-        severity, ne, from_time, to_time, "alarm->>'last_detected'", correlated_only, include_root
+        severity, ne, from_time, to_time, "last_detected", correlated_only, include_root,
+        after=after, order_field="last_updated",
     )
 
     sql = f"""
     SELECT
         alarm_id,
-        alarm->>'alarm_name' AS alarm_name,
-        alarm->>'ne_name' AS ne_name,
-        alarm->>'severity' AS severity,
-        alarm->>'first_detected' AS first_detected,
-        alarm->>'last_detected' AS last_detected,
+        alarm_name,
+        ne_name,
+        severity,
+        first_detected,
+        last_detected,
         last_updated
+        {", alarm::text" if fmt == "jsonl" else ""}
     FROM active_alarms
     {where_sql}
-    ORDER BY last_updated DESC
+    ORDER BY last_updated DESC, alarm_id DESC
     LIMIT %s;
     """
-    params.append(limit)
+    params.append(limit or None)   # 0 -> no limit
 
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(sql, params)
-        rows = cur.fetchall()
+    rows = stream_rows(sql, params, "alarm_view_active")
+
+    if fmt == "csv":
+        write_csv(rows, ACTIVE_KEYS)
+        return
+    if fmt == "jsonl":
+        write_jsonl(rows, ACTIVE_KEYS)
+        return
+
+    rows = list(rows)
 
     if not rows:
         print("✅ No active alarms")
         return
 
     print("\n🚨 ACTIVE ALARMS\n")
-    print(tabulate(
-        rows,
-        headers=[
-            "Alarm ID",
-            "Alarm Name",
-            "NE",
-            "Severity",
-            "First Detected",
-            "Last Detected",
-            "Updated At"
-        ],
-        tablefmt="psql"
-    ))
+    print(tabulate(rows, headers=ACTIVE_HEADERS, tablefmt="psql"))
+    print_next_page(rows, limit, ACTIVE_KEYS.index("last_updated"))
 
 # -------------------------------
 # HISTORY alarms (list)
 # -------------------------------
-def show_history(limit, severity, ne, from_time, to_time):
+HISTORY_HEADERS = ["Alarm ID", "Alarm Name", "NE", "Severity", "Last Detected", "Cleared At"]
+HISTORY_KEYS = ["alarm_id", "alarm_name", "ne_name", "severity", "last_detected", "cleared_at"]
+
+
+def show_history(limit, severity, ne, from_time, to_time, after=None, fmt="table"):
     where_sql, params = build_filters(
-        severity, ne, from_time, to_time, "cleared_at"
+        severity, ne, from_time, to_time, "cleared_at",
+        after=after, order_field="cleared_at",
     )
 
     sql = f"""
     SELECT
         alarm_id,
-        alarm->>'alarm_name' AS alarm_name,
-        alarm->>'ne_name' AS ne_name,
-        alarm->>'severity' AS severity,
-        alarm->>'last_detected' AS last_detected,
+        alarm_name,
+        ne_name,
+        severity,
+        last_detected,
         cleared_at
+        {", alarm::text" if fmt == "jsonl" else ""}
     FROM alarm_history
     {where_sql}
-    ORDER BY cleared_at DESC
+    ORDER BY cleared_at DESC, alarm_id DESC
     LIMIT %s;
     """
 
-    params.append(limit)
+    params.append(limit or None)   # 0 -> no limit
 
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(sql, params)
-        rows = cur.fetchall()
+    rows = stream_rows(sql, params, "alarm_view_history")
+
+    if fmt == "csv":
+        write_csv(rows, HISTORY_KEYS)
+        return
+    if fmt == "jsonl":
+        write_jsonl(rows, HISTORY_KEYS)
+        return
+
+    rows = list(rows)
 
     if not rows:
         print("✅ No historical alarms")
         return
 
     print("\n📜 ALARM HISTORY\n")
-    print(tabulate(
-        rows,
-        headers=[
-            "Alarm ID",
-            "Alarm Name",
-            "NE",
-            "Severity",
-            "Last Detected",
-            "Cleared At"
-        ],
-        tablefmt="psql"
-    ))
+    print(tabulate(rows, headers=HISTORY_HEADERS, tablefmt="psql"))
+    print_next_page(rows, limit, HISTORY_KEYS.index("cleared_at"))
 
 # -------------------------------
 # FULL views
@@ -215,11 +294,13 @@ def purge_active():
 # CLI
 # -------------------------------
 def add_common_filters(p):
-    p.add_argument("--limit", type=int, choices=[20, 30, 40, 50, 100], default=20)
+    p.add_argument("--limit", type=int, default=20, help="Max rows (0 = all, for csv/jsonl export)")
     p.add_argument("--severity", choices=["CRITICAL", "MAJOR", "MINOR", "WARNING", "INFO", "CLEAR"])
     p.add_argument("--ne", help="Filter by NE name (partial match)")
     p.add_argument("--from-time", help="Start time (ISO 8601, e.g. 2026-01-23T10:00:00Z)")
     p.add_argument("--to-time", help="End time (ISO 8601, e.g. 2026-01-23T12:00:00Z)")
+    p.add_argument("--after", type=parse_after, help="Next page: '<timestamp>,<alarm_id>' of the last row shown")
+    p.add_argument("--format", choices=OUTPUT_FORMATS, default="table", help="csv / jsonl stream to stdout")
 
 def main():
     parser = ArgumentParser("NSP Alarm Viewer")
@@ -250,9 +331,10 @@ def main():
     args = parser.parse_args()
 
     if args.cmd == "active":
-        show_active(args.limit, args.severity, args.ne, args.from_time, args.to_time, args.correlated_only, not args.exclude_root)
+        show_active(args.limit, args.severity, args.ne, args.from_time, args.to_time, args.correlated_only, not args.exclude_root,
+                    args.after, args.format)
     elif args.cmd == "history":
-        show_history(args.limit, args.severity, args.ne, args.from_time, args.to_time)
+        show_history(args.limit, args.severity, args.ne, args.from_time, args.to_time, args.after, args.format)
     elif args.cmd == "active-full":
         show_active_full(args.alarm_id)
     elif args.cmd == "history-full":
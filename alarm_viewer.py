@@ -28,10 +28,10 @@ def show_active(limit=20):
     sql = """
     SELECT
         alarm_id,
-        alarm->>'alarm_name',
-        alarm->>'ne_name',
-        alarm->>'severity',
-        alarm->>'last_detected',
+        alarm_name,
+        ne_name,
+        severity,
+        last_detected,
         last_updated
     FROM active_alarms
     ORDER BY last_updated DESC
@@ -67,9 +67,9 @@ def show_history(limit=20):
     sql = """
     SELECT
         alarm_id,
-        alarm->>'alarm_name',
-        alarm->>'ne_name',
-        alarm->>'severity',
+        alarm_name,
+        ne_name,
+        severity,
         cleared_at
     FROM alarm_history
     ORDER BY cleared_at DESC
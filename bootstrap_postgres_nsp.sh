@@ -104,16 +104,20 @@ BEFORE UPDATE ON active_alarms
 FOR EACH ROW
 EXECUTE FUNCTION set_last_updated();
 
--- ===============================
--- Indexes (JSON-friendly)
--- ===============================
-CREATE INDEX IF NOT EXISTS idx_active_alarms_alarm_gin
-ON active_alarms USING GIN (alarm);
+EOF
+
+### ===============================
+### Step 5b: Migrations (idempotent, applied in order)
+### ===============================
+log "Applying schema migrations"
 
-CREATE INDEX IF NOT EXISTS idx_alarm_history_alarm_gin
-ON alarm_history USING GIN (alarm);
+MIGRATIONS_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/migrations"
 
-EOF
+for migration in "${MIGRATIONS_DIR}"/*.sql; do
+  [ -e "${migration}" ] || continue
+  log "Applying $(basename "${migration}")"
+  sudo -u postgres psql -v ON_ERROR_STOP=1 -d "${PG_DB}" -f - < "${migration}"
+done
 
 ### ===============================
 ### Step 6: Permissions
@@ -143,6 +147,10 @@ GRANT SELECT, INSERT, UPDATE, DELETE ON TABLES TO ${PG_USER};
 
 ALTER DEFAULT PRIVILEGES IN SCHEMA public
 GRANT USAGE, SELECT ON SEQUENCES TO ${PG_USER};
+
+-- alarm_history partition maintenance (SECURITY DEFINER, revoked from PUBLIC)
+GRANT EXECUTE ON FUNCTION create_alarm_history_partition(DATE) TO ${PG_USER};
+GRANT EXECUTE ON FUNCTION drop_alarm_history_partition(TEXT, BOOLEAN) TO ${PG_USER};
 EOF
 
 log "✅ PostgreSQL alarm schema ready"
@@ -0,0 +1,75 @@
+"""
+child_hold.py
+
+Hold-back buffer for candidate CHILD alarms (single mode).
+
+NSP often delivers a child (Transport Failure, Power Adjustment ...) a
+few hundred ms before its root. drop_reason cannot suppress it then, so
+the child would be written and, once the root arrives, retracted again.
+
+Creates that match a child selector of correlation_rules.json are held
+per alarm_id for CHILD_HOLD_MS instead (with every later event of the
+same alarm, to keep their order). When a root arrives, suppress() drops
+the held children it correlates with; children still held when the
+window expires are released and written. Children of roots that arrive
+even later are retracted by handle_alarm_lifecycle / handle_alarm_batch.
+
+Released events are reduced like flapping alarms (see FlapCoalescer),
+so the hold window should not be shorter than FLAP_WINDOW_MS.
+"""
+
+import time
+
+from flap_coalescer import FlapCoalescer
+from correlation_rules import get_correlation_rules
+from time_utils import iso_to_epoch_ms
+
+
+class ChildHoldBuffer(FlapCoalescer):
+    def __init__(self, window_ms, rules=None, clock=time.monotonic):
+        super().__init__(window_ms, clock)
+        self._rules = rules
+
+    @property
+    def rules(self):
+        if self._rules is None:
+            self._rules = get_correlation_rules()
+        return self._rules
+
+    def is_candidate(self, alarm):
+        """
+        True for a create that could still turn out to be a child.
+        """
+        return (
+            alarm.get("event_type") == "alarm-create"
+            and alarm.get("severity") != "CLEAR"
+            and bool(self.rules.child_rules(alarm))
+            and not self.rules.keeps(alarm)
+        )
+
+    def holds(self, alarm):
+        """
+        True if `alarm` belongs in the buffer: a candidate child, or a
+        later event of an alarm that is already held.
+        """
+        return alarm.get("alarm_id") in self._pending or self.is_candidate(alarm)
+
+    def suppress(self, correlation_index):
+        """
+        Drop every held child that now correlates with a root in
+        `correlation_index`. Returns (rule names, tokens) of the dropped
+        children; their events are never written.
+        """
+        rules = []
+        tokens = []
+
+        for alarm_id, (_, held, held_tokens) in list(self._pending.items()):
+            create = held[0]
+            ts = iso_to_epoch_ms(create.get("first_detected"))
+            rule = correlation_index.correlated_rule(create, ts) if ts is not None else None
+            if rule:
+                del self._pending[alarm_id]
+                rules.append(rule)
+                tokens.extend(held_tokens)
+
+        return rules, tokens
@@ -1,56 +1,137 @@
-import psycopg2
-
-DB_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 5432,
-    "dbname": "nsp",
-    "user": "nsp_user",
-    "password": "nsp_pass",
-}
-
-DELETE_SQL = """
-DELETE FROM nsp_alarms
-WHERE
-    alarm_name = 'Quality Threshold Crossed 15m'
- OR alarm_name = 'Channel optical power out of range'
- OR alarm_name = 'Power management suspended'
- OR probable_cause IN ('OPR', 'PWRSUSP');
- OR alarm_name = 'Underlying resource unavailable - optical'
+#!/usr/bin/env python3
 """
+cleanup_alarms.py
 
-COUNT_SQL = """
-SELECT COUNT(*)
-FROM nsp_alarms
-WHERE
-    alarm_name = 'Quality Threshold Crossed 15m'
- OR alarm_name = 'Channel optical power out of range'
- OR alarm_name = 'Power management suspended'
- OR probable_cause IN ('OPR', 'PWRSUSP');
+Re-evaluate every stored active alarm against the CURRENT filter policy
+(alarm_filters.drop_reason: keep rules, correlation and filter_rules.json)
+and delete the ones it would drop today.
+
+- active_alarms is streamed through a server-side cursor, CHUNK_SIZE
+  rows per round-trip
+- correlation runs against an in-memory snapshot of the active roots,
+  exactly like the consumer
+- matches are deleted with batched DELETE ... WHERE alarm_id = ANY(...),
+  one commit per batch
+
+Run after tightening filter_rules.json; use --dry-run first.
 """
 
+from argparse import ArgumentParser
+from collections import Counter
+
+from active_alarm_index import ActiveAlarmIndex
+from alarm_filters import drop_reason
+from alarm_lifecycle import get_active_root_alarms
+from db_pool import get_conn
+from time_utils import iso_to_epoch_ms
+
+CHUNK_SIZE = 5000
+DELETE_BATCH_SIZE = 1000
+
+SCAN_SQL = "SELECT alarm_id, alarm FROM active_alarms;"
+
+DELETE_SQL = "DELETE FROM active_alarms WHERE alarm_id = ANY(%s);"
+
+
+# -------------------------------
+# Policy
+# -------------------------------
+def stored_drop_reason(alarm, correlation_index):
+    """
+    drop_reason() for an alarm document as stored in active_alarms.
+    """
+    return drop_reason(
+        alarm_name=alarm.get("alarm_name"),
+        specific_problem=alarm.get("specific_problem"),
+        probable_cause=alarm.get("probable_cause"),
+        ne_name=alarm.get("ne_name"),
+        ne_id=alarm.get("ne_id"),
+        source=alarm.get("source"),
+        object_type=alarm.get("object_type"),
+        severity=alarm.get("severity"),
+        affected_object_name=alarm.get("affected_object_name"),
+        affected_object=alarm.get("affected_object"),
+        first_detected=iso_to_epoch_ms(alarm.get("first_detected")),
+        correlation_index=correlation_index,
+    )
+
+
+def build_snapshot():
+    """
+    Correlation snapshot of the stored roots that survive the current
+    policy themselves (a root about to be deleted must not suppress
+    its children). Stored alarms come in no time order, so roots are
+    never expired from it.
+    """
+    roots = get_active_root_alarms()
+
+    snapshot = ActiveAlarmIndex(expire=False)
+    snapshot.warm(a for a in roots if stored_drop_reason(a, None) is None)
+    return snapshot
 
-def main():
-    conn = psycopg2.connect(**DB_CONFIG)
-    try:
-        with conn.cursor() as cur:
-            # Preview
-            cur.execute(COUNT_SQL)
-            count = cur.fetchone()[0]
 
-            if count == 0:
-                print("✅ No noisy alarms found. Nothing to delete.")
-                return
+# -------------------------------
+# Bulk job
+# -------------------------------
+def delete_batch(alarm_ids):
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(DELETE_SQL, (alarm_ids,))
+        return cur.rowcount
 
-            print(f"⚠️ {count} noisy alarms found")
 
-            # Delete
-            cur.execute(DELETE_SQL)
-            conn.commit()
+def reevaluate(dry_run=False):
+    snapshot = build_snapshot()
+    print(f"🧠 Correlation snapshot: {len(snapshot)} active root alarms")
+
+    scanned = 0
+    deleted = 0
+    reasons = Counter()
+    pending = []
+
+    with get_conn() as conn:
+        with conn.cursor(name="cleanup_alarms_scan") as cur:
+            cur.itersize = CHUNK_SIZE
+            cur.execute(SCAN_SQL)
+
+            for alarm_id, alarm in cur:
+                scanned += 1
+
+                reason = stored_drop_reason(alarm or {}, snapshot)
+                if reason is None:
+                    continue
+
+                reasons[reason] += 1
+                pending.append(alarm_id)
+
+                if len(pending) >= DELETE_BATCH_SIZE:
+                    if not dry_run:
+                        deleted += delete_batch(pending)
+                    pending = []
+
+    if pending and not dry_run:
+        deleted += delete_batch(pending)
+
+    return scanned, deleted, reasons
+
+
+def main():
+    parser = ArgumentParser("Re-apply the current filter policy to active_alarms")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be deleted, per rule")
+    args = parser.parse_args()
+
+    scanned, deleted, reasons = reevaluate(args.dry_run)
+    matched = sum(reasons.values())
 
-            print(f"🗑️ Deleted {count} noisy alarms")
+    print(f"🔎 Scanned {scanned} active alarms, {matched} match the current drop policy")
+    for rule, count in reasons.most_common():
+        print(f"   {rule:<32} {count}")
 
-    finally:
-        conn.close()
+    if not matched:
+        print("✅ No noisy alarms found. Nothing to delete.")
+    elif args.dry_run:
+        print("🧪 Dry run: nothing deleted")
+    else:
+        print(f"🗑️ Deleted {deleted} noisy alarms")
 
 
 if __name__ == "__main__":
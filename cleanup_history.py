@@ -1,36 +1,128 @@
-import psycopg2
-from datetime import timedelta, datetime
+#!/usr/bin/env python3
+"""
+cleanup_history.py
 
-DB_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 5432,
-    "dbname": "nsp",
-    "user": "nsp_user",
-    "password": "nsp_pass",
-}
+alarm_history maintenance (run daily from the systemd timer):
+
+  1. create the monthly partitions for the next few months ahead
+  2. enforce retention by detaching + dropping whole partitions
+     (no row-by-row DELETE: no WAL storm, no bloat, no long locks)
+
+A month is dropped once ALL of it is older than the retention window,
+so rows are kept for up to one extra month.
+Needs migrations/003_partition_alarm_history.sql.
+"""
+
+import re
+from argparse import ArgumentParser
+from datetime import date, datetime, timedelta, timezone
+
+from db_pool import get_conn
 
 RETENTION_DAYS = 90
+MONTHS_AHEAD = 3
+
+PARTITION_NAME = re.compile(r"^alarm_history_(\d{4})_(\d{2})$")
+
+LIST_PARTITIONS_SQL = """
+SELECT c.relname
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'alarm_history'::regclass
+ORDER BY c.relname;
+"""
+
+
+# -------------------------------
+# Month arithmetic (UTC, like the partition bounds)
+# -------------------------------
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_month(name):
+    m = PARTITION_NAME.match(name)
+    if not m:
+        return None   # e.g. alarm_history_default
+    return date(int(m.group(1)), int(m.group(2)), 1)
+
+
+def expired_partitions(names, retention_days, now):
+    """
+    Partitions whose whole month ended before now - retention_days.
+    """
+    cutoff = (now - timedelta(days=retention_days)).date()
+    expired = []
+
+    for name in names:
+        month = partition_month(name)
+        if month is not None and add_months(month, 1) <= cutoff:
+            expired.append(name)
+
+    return expired
+
+
+# -------------------------------
+# Maintenance
+# -------------------------------
+def ensure_future_partitions(cur, months_ahead, now, dry_run=False):
+    if dry_run:
+        return []
+
+    this_month = date(now.year, now.month, 1)
+    created = []
+
+    for n in range(months_ahead + 1):
+        month = add_months(this_month, n)
+        cur.execute("SELECT create_alarm_history_partition(%s);", (month,))
+        name = cur.fetchone()[0]
+        if name:
+            created.append(name)
+
+    return created
+
+
+def maintain(retention_days=RETENTION_DAYS, months_ahead=MONTHS_AHEAD, detach_only=False, dry_run=False):
+    now = datetime.now(timezone.utc)
+
+    with get_conn() as conn, conn.cursor() as cur:
+        for name in ensure_future_partitions(cur, months_ahead, now, dry_run):
+            print(f"📅 Created partition {name}")
+
+        cur.execute(LIST_PARTITIONS_SQL)
+        names = [row[0] for row in cur.fetchall()]
+
+        expired = expired_partitions(names, retention_days, now)
+        action = "Detached" if detach_only else "Dropped"
+
+        for name in expired:
+            if dry_run:
+                print(f"🔎 Would {'detach' if detach_only else 'drop'} {name}")
+                continue
+            cur.execute("SELECT drop_alarm_history_partition(%s, %s);", (name, detach_only))
+            if cur.fetchone()[0]:
+                print(f"🧹 {action} partition {name}")
+
+        cur.execute("SELECT count(*) FROM alarm_history_default;")
+        stray = cur.fetchone()[0]
+        if stray:
+            print(f"⚠️ {stray} rows in alarm_history_default (outside every monthly partition)")
 
+    if not expired:
+        print(f"🧹 No partitions older than {retention_days} days")
 
-def cleanup():
-    conn = psycopg2.connect(**DB_CONFIG)
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                DELETE FROM alarm_history
-                WHERE cleared_at < now() - interval '%s days'
-                """,
-                (RETENTION_DAYS,)
-            )
 
-            deleted = cur.rowcount
-            conn.commit()
+def main():
+    parser = ArgumentParser("alarm_history maintenance")
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+    parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD, help="Future partitions to pre-create")
+    parser.add_argument("--detach-only", action="store_true", help="Detach expired partitions but keep the tables (archive)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be dropped")
+    args = parser.parse_args()
 
-            print(f"🧹 Deleted {deleted} historical alarms older than {RETENTION_DAYS} days")
-    finally:
-        conn.close()
+    maintain(args.retention_days, args.months_ahead, args.detach_only, args.dry_run)
 
 
 if __name__ == "__main__":
-    cleanup()
+    main()
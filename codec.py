@@ -0,0 +1,68 @@
+"""
+codec.py
+
+JSON codec used on the hot path (Kafka decode, JSONB writes, log lines).
+
+- loads() parses straight from the Kafka message bytes (no bytes -> str copy)
+- dumps() returns a str ready to be bound as a %s::jsonb parameter
+- orjson is used when installed, the stdlib json module otherwise
+
+Environment:
+  JSON_BACKEND   auto (default) | orjson | json
+"""
+
+import json
+import os
+
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto").lower()
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+if JSON_BACKEND == "orjson" and orjson is None:
+    raise RuntimeError("JSON_BACKEND=orjson but orjson is not installed")
+
+if orjson is not None and JSON_BACKEND != "json":
+    BACKEND = "orjson"
+
+    # datetimes etc. go through default=str, exactly like the json backend
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS).decode()
+
+else:
+    BACKEND = "json"
+
+    def loads(data):
+        # json.loads() detects the UTF-8/16/32 encoding of bytes itself
+        return json.loads(data)
+
+    def dumps(obj):
+        return json.dumps(obj, default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+# -------------------------------
+# Pre-encoded payloads
+# -------------------------------
+class EncodedJSON(str):
+    """
+    A document that is already JSON text.
+
+    Passed as a log `extra` field so the log formatter embeds the exact
+    text written to Postgres instead of serializing the alarm again.
+    """
+
+    __slots__ = ()
+
+
+def encode(obj):
+    """
+    Serialize once; the result can be bound to SQL and logged as-is.
+    """
+    return EncodedJSON(dumps(obj))
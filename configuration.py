@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,8 +13,47 @@ KAFKA_KEYSTORE_PASSWORD = os.getenv("KAFKA_KEYSTORE_PASSWORD")
 AUTH_URL = f"https://{NSP_SERVER}:8443/rest-gateway/rest/api/v1/auth/token"
 SUBSCRIPTION_URL = f"https://{NSP_SERVER}:8443/nbi-notification/api/v1/notifications/subscriptions"
 REVOKE_URL = f"https://{NSP_SERVER}:8443/rest-gateway/rest/api/v1/auth/revocation"
+ALARM_LIST_URL = os.getenv(
+    "NSP_ALARM_LIST_URL",
+    f"https://{NSP_SERVER}:8545/restconf/data/nsp-fault:alarms/alarm-list",
+)
+
+# Resume position comes from the kafka_offsets table (offset_store.py),
+# so the group id no longer has to be stable across hosts
+KAFKA_GROUP_ID = os.getenv("KAFKA_GROUP_ID", f"nsp-python-{socket.gethostname()}")
 
 VERIFY_SSL = False
 
+# -------------------------------
+# Consumer pipeline tuning
+# -------------------------------
+# single   -> one message / one transaction
+# batch    -> up to BATCH_SIZE messages or BATCH_TIMEOUT_MS per transaction
+# parallel -> WORKER_COUNT workers, sharded by alarm_id
+CONSUMER_MODE = os.getenv("CONSUMER_MODE", "single")
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "500"))
+BATCH_TIMEOUT_MS = int(os.getenv("BATCH_TIMEOUT_MS", "200"))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "4"))
+COMMIT_INTERVAL_MS = int(os.getenv("COMMIT_INTERVAL_MS", "1000"))
+
+# parallel mode backpressure: pause the assigned partitions once a
+# worker queue holds QUEUE_HIGH_WATER events, resume at QUEUE_LOW_WATER
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+QUEUE_HIGH_WATER = int(os.getenv("QUEUE_HIGH_WATER", "800"))
+QUEUE_LOW_WATER = int(os.getenv("QUEUE_LOW_WATER", "200"))
+
+# single mode only: hold each alarm's events this long and write their
+# net effect (collapses create/CLEAR flaps). 0 = disabled
+FLAP_WINDOW_MS = int(os.getenv("FLAP_WINDOW_MS", "0"))
+
+# single mode only: hold creates that may be correlation children this
+# long, so a root delivered just after them still suppresses them.
+# Children of later roots are deleted from active_alarms. 0 = disabled
+CHILD_HOLD_MS = int(os.getenv("CHILD_HOLD_MS", "0"))
+
+# Startup resync of active_alarms from NSP's alarm list, this many
+# alarms per REST page. 0 = disabled
+RESYNC_PAGE_SIZE = int(os.getenv("RESYNC_PAGE_SIZE", "1000"))
+
 if not all([USERNAME, PASSWORD, KAFKA_KEYSTORE_PASSWORD]):
     raise RuntimeError("❌ Missing required environment variables")
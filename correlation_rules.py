@@ -0,0 +1,176 @@
+"""
+correlation_rules.py
+
+Data-driven root / child correlation rules (CORRELATION_RULES_PATH,
+default correlation_rules.json next to this module):
+
+  {
+    "name": "los_child",                      drop reason for suppressed children
+    "root":  {"alarm_name": [..], "object_type": [..], "severity": [..]},
+    "child": {"alarm_name": [..], "object_type": [..], "severity": [..]},
+    "match": ["ops_span", "ne_name"],         any shared key correlates
+    "window_seconds": 30,                     |child - root| first_detected
+    "lateness_seconds": 3600,                 optional, see ActiveAlarmIndex
+    "keep_root": false                        optional, never drop the root
+  }
+
+alarm_name is required in both selectors (events are dispatched by it);
+the other selector fields are optional. Match keys: see MATCH_KEYS.
+"""
+
+import json
+import os
+import threading
+
+from filter_rules import RuleError
+from object_parser import extract_ops_span, parse_affected_object
+
+DEFAULT_CORRELATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "correlation_rules.json")
+CORRELATION_RULES_PATH = os.getenv("CORRELATION_RULES_PATH", DEFAULT_CORRELATION_PATH)
+
+RULE_KEYS = {"name", "description", "root", "child", "match", "window_seconds", "lateness_seconds", "keep_root"}
+SELECTOR_FIELDS = {"alarm_name", "object_type", "severity"}
+
+DEFAULT_LATENESS_SECONDS = 3600
+
+
+# -------------------------------
+# Match keys (alarm dict -> key or None)
+# -------------------------------
+def _ops_span(alarm):
+    return extract_ops_span(alarm.get("affected_object_name"))
+
+
+def _ne_name(alarm):
+    return alarm.get("ne_name")
+
+
+def _shelf_slot(alarm):
+    details = alarm.get("object_details") or parse_affected_object(alarm.get("affected_object"))
+    ne_name = alarm.get("ne_name")
+    if ne_name and details.get("shelf") and details.get("slot"):
+        return f"{ne_name}/{details['shelf']}/{details['slot']}"
+    return None
+
+
+MATCH_KEYS = {
+    "ops_span": _ops_span,
+    "ne_name": _ne_name,
+    "shelf_slot": _shelf_slot,
+}
+
+
+# -------------------------------
+# Compiled rules
+# -------------------------------
+class Selector:
+    def __init__(self, spec, where):
+        if not isinstance(spec, dict) or not spec.get("alarm_name"):
+            raise RuleError(f"{where}: needs at least 'alarm_name'")
+        unknown = set(spec) - SELECTOR_FIELDS
+        if unknown:
+            raise RuleError(f"{where}: unknown fields {sorted(unknown)}")
+
+        self.fields = [
+            (field, frozenset([values] if isinstance(values, str) else values))
+            for field, values in spec.items()
+        ]
+        self.alarm_names = dict(self.fields)["alarm_name"]
+
+    def matches(self, alarm):
+        return all(alarm.get(field) in values for field, values in self.fields)
+
+
+class CorrelationRule:
+    def __init__(self, index, rule):
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise RuleError(f"correlation rule #{index}: unknown keys {sorted(unknown)}")
+
+        self.name = rule.get("name")
+        if not self.name:
+            raise RuleError(f"correlation rule #{index}: 'name' is required")
+
+        self.root = Selector(rule.get("root"), f"correlation rule {self.name!r} root")
+        self.child = Selector(rule.get("child"), f"correlation rule {self.name!r} child")
+
+        match = rule.get("match") or []
+        unknown = set(match) - set(MATCH_KEYS)
+        if not match or unknown:
+            raise RuleError(f"correlation rule {self.name!r}: 'match' must list keys from {sorted(MATCH_KEYS)}")
+        self.keys = [(key, MATCH_KEYS[key]) for key in match]
+
+        try:
+            self.window_ms = round(float(rule["window_seconds"]) * 1000)
+            self.lateness_ms = round(float(rule.get("lateness_seconds", DEFAULT_LATENESS_SECONDS)) * 1000)
+        except (KeyError, TypeError, ValueError):
+            raise RuleError(f"correlation rule {self.name!r}: numeric 'window_seconds' is required") from None
+
+        self.keep_root = bool(rule.get("keep_root", False))
+
+
+class CorrelationRules:
+    def __init__(self, rules, source=None):
+        self.source = source
+        self.rules = [CorrelationRule(i, rule) for i, rule in enumerate(rules)]
+
+        # alarm_name -> indexes of the rules it is a root / child of
+        self._by_root = {}
+        self._by_child = {}
+        for i, rule in enumerate(self.rules):
+            for name in rule.root.alarm_names:
+                self._by_root.setdefault(name, []).append(i)
+            for name in rule.child.alarm_names:
+                self._by_child.setdefault(name, []).append(i)
+
+        self.root_names = sorted(self._by_root)
+        self.child_names = sorted(self._by_child)
+
+    def root_rules(self, alarm):
+        """
+        Indexes of the rules `alarm` is a root of.
+        """
+        return [i for i in self._by_root.get(alarm.get("alarm_name"), ()) if self.rules[i].root.matches(alarm)]
+
+    def child_rules(self, alarm):
+        """
+        Indexes of the rules `alarm` is a child of.
+        """
+        return [i for i in self._by_child.get(alarm.get("alarm_name"), ()) if self.rules[i].child.matches(alarm)]
+
+    def is_root(self, alarm):
+        return bool(self.root_rules(alarm))
+
+    def keeps(self, alarm):
+        """
+        True if `alarm` is the root of a keep_root rule.
+        """
+        return any(self.rules[i].keep_root for i in self.root_rules(alarm))
+
+    def __len__(self):
+        return len(self.rules)
+
+
+# -------------------------------
+# Loading
+# -------------------------------
+def load_correlation_rules(path=CORRELATION_RULES_PATH):
+    with open(path, encoding="utf-8") as f:
+        doc = json.load(f)
+    return CorrelationRules(doc.get("rules", []), source=path)
+
+
+_lock = threading.Lock()
+_rules = None
+
+
+def get_correlation_rules():
+    """
+    The active correlation rules (loaded on first use).
+    """
+    global _rules
+    if _rules is None:
+        with _lock:
+            if _rules is None:
+                _rules = load_correlation_rules()
+    return _rules
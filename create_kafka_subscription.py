@@ -1,5 +1,8 @@
-import requests
-from configuration import SUBSCRIPTION_URL, VERIFY_SSL
+import logging
+from configuration import SUBSCRIPTION_URL
+from http_session import request
+
+log = logging.getLogger(__name__)
 
 
 def create_subscription(token_mgr):
@@ -10,17 +13,18 @@ def create_subscription(token_mgr):
 
     payload = {"categories": [{"name": "NSP-FAULT"}]}
 
-    response = requests.post(
+    response = request(
+        "POST",
         SUBSCRIPTION_URL,
         headers=headers,
         json=payload,
-        verify=VERIFY_SSL
     )
     response.raise_for_status()
 
     data = response.json()["response"]["data"]
-    print("✅ Subscription created")
-    print("Subscription ID:", data["subscriptionId"])
-    print("Kafka Topic:", data["topicId"])
+    log.info(
+        "✅ Subscription created",
+        extra={"subscription_id": data["subscriptionId"], "topic": data["topicId"]},
+    )
 
     return data["subscriptionId"], data["topicId"]
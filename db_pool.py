@@ -0,0 +1,189 @@
+"""
+db_pool.py
+
+Shared Postgres connection pool for the consumer process.
+
+All alarm lifecycle writes and correlation queries borrow connections
+from here instead of opening a new TCP + auth handshake per call.
+Connections are health-checked on checkout and discarded on
+connection-level errors, so the pool recovers after a Postgres restart.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import cursor as pg_cursor
+from psycopg2.extras import register_default_jsonb
+from dotenv import load_dotenv
+
+import codec
+from metrics import DB_ROUND_TRIP
+
+load_dotenv()
+
+# JSONB columns are parsed with the same (optionally fast) codec
+register_default_jsonb(globally=True, loads=codec.loads)
+
+# -------------------------------
+# Database configuration
+# -------------------------------
+DB_CONFIG = {
+    "host": os.getenv("PG_HOST", "127.0.0.1"),
+    "port": int(os.getenv("PG_PORT", "5432")),
+    "dbname": os.getenv("PG_DB", "nsp"),
+    "user": os.getenv("PG_USER", "nsp_user"),
+    "password": os.getenv("PG_PASSWORD", "nsp_pass"),
+
+    # Detect dead peers (e.g. Postgres restarted) on idle connections
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+POOL_MIN_CONN = int(os.getenv("PG_POOL_MIN", "1"))
+POOL_MAX_CONN = int(os.getenv("PG_POOL_MAX", "4"))
+
+# Connections idle longer than this are pinged before reuse
+HEALTHCHECK_IDLE_SECONDS = float(os.getenv("PG_POOL_HEALTHCHECK_IDLE", "30"))
+
+# Errors that mean the connection itself is unusable
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+# -------------------------------
+# Round-trip timing
+# -------------------------------
+class TimedCursor(pg_cursor):
+    """
+    Cursor that records every statement round-trip in DB_ROUND_TRIP.
+    """
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            DB_ROUND_TRIP.observe(time.perf_counter() - started)
+
+
+# -------------------------------
+# Pool
+# -------------------------------
+class ConnectionPool:
+    def __init__(self, minconn, maxconn, **db_config):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.db_config = db_config
+
+        self._pool = None
+        self._lock = threading.Lock()
+        # ThreadedConnectionPool raises when exhausted; block instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = pg_pool.ThreadedConnectionPool(
+                        self.minconn, self.maxconn, **self.db_config
+                    )
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+
+        last_used = self._last_used.get(id(conn))
+        if last_used is None:
+            return True  # freshly opened by the pool
+
+        if time.monotonic() - last_used < HEALTHCHECK_IDLE_SECONDS:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except CONNECTION_ERRORS:
+            return False
+
+    def getconn(self):
+        self._slots.acquire()
+        try:
+            pool = self._get_pool()
+
+            # At most one retry per pooled connection before a fresh connect
+            for _ in range(self.maxconn + 1):
+                conn = pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self._discard(conn)
+
+            return pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, broken=False):
+        try:
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._get_pool().putconn(conn)
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        try:
+            self._get_pool().putconn(conn, close=True)
+        except pg_pool.PoolError:
+            pass
+
+    def closeall(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            self._last_used.clear()
+
+
+db_pool = ConnectionPool(
+    POOL_MIN_CONN, POOL_MAX_CONN, cursor_factory=TimedCursor, **DB_CONFIG
+)
+
+
+# -------------------------------
+# Connection helper
+# -------------------------------
+@contextmanager
+def get_conn():
+    """
+    Borrow a pooled connection for one transaction.
+    Commits on success, rolls back on error, and drops the
+    connection from the pool if it turned out to be broken.
+    """
+    conn = db_pool.getconn()
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except CONNECTION_ERRORS:
+        broken = True
+        raise
+    except Exception:
+        try:
+            conn.rollback()
+        except CONNECTION_ERRORS:
+            broken = True
+        raise
+    finally:
+        db_pool.putconn(conn, broken=broken)
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+dead_letters.py
+
+Append-only dead-letter store for messages the pipeline could not
+handle (invalid JSON, normalize_alarm() or lifecycle failures, e.g.
+during a Postgres outage), plus a bulk replay command.
+
+Records are JSON lines in local segment files under DEAD_LETTER_DIR,
+NOT in Postgres: the store must keep working while the DB is down.
+The consumer only enqueues; a background thread appends in batches, so
+the hot loop never waits on the disk. A segment is written as
+dead-<time>-<pid>.jsonl.open and sealed (renamed to .jsonl) when it
+reaches DEAD_LETTER_SEGMENT_BYTES, after DEAD_LETTER_IDLE_SECONDS
+without failures, or on shutdown. Replay only reads sealed segments.
+
+  python dead_letters.py list
+  python dead_letters.py replay [--dry-run]
+
+Replay re-drives every record through normalize_alarm() and writes the
+result with handle_alarm_batch(). Records whose alarm was written live
+after they failed (cleared to alarm_history or updated in active_alarms
+after failed_at) are skipped: replaying them would undo newer state,
+e.g. re-raise an alarm whose CLEAR succeeded after the outage.
+Replayed segments are renamed to .jsonl.replayed; records that still
+fail go to a new segment.
+
+Environment:
+  DEAD_LETTER_DIR             segment directory (default ./dead_letters)
+  DEAD_LETTER_SEGMENT_BYTES   roll-over size (default 64 MiB)
+"""
+
+import base64
+import glob
+import logging
+import os
+import queue
+import threading
+from argparse import ArgumentParser
+from collections import Counter
+from datetime import datetime, timezone
+
+from codec import dumps, loads
+from metrics import DEAD_LETTERS, ERRORS
+
+log = logging.getLogger(__name__)
+
+DEAD_LETTER_DIR = os.getenv("DEAD_LETTER_DIR", "dead_letters")
+DEAD_LETTER_SEGMENT_BYTES = int(os.getenv("DEAD_LETTER_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+DEAD_LETTER_IDLE_SECONDS = 5
+DEAD_LETTER_QUEUE_SIZE = 100_000
+WRITE_BATCH = 500
+
+REPLAY_BATCH_SIZE = 500
+
+# Latest live write per alarm_id: CLEAR move or active row update.
+# Compared with failed_at (consumer host clock), so keep clocks in sync
+LAST_WRITTEN_SQL = """
+SELECT alarm_id, max(written_at)
+FROM (
+    SELECT alarm_id, cleared_at AS written_at
+    FROM alarm_history
+    WHERE alarm_id = ANY(%(ids)s)
+    UNION ALL
+    SELECT alarm_id, last_updated
+    FROM active_alarms
+    WHERE alarm_id = ANY(%(ids)s)
+) w
+GROUP BY alarm_id;
+"""
+
+OPEN_SUFFIX = ".open"
+REPLAYED_SUFFIX = ".replayed"
+
+_STOP = object()
+
+
+# -------------------------------
+# Records
+# -------------------------------
+def build_record(stage, error, payload=None, source=None, alarm=None):
+    """
+    payload: raw Kafka value (bytes / str) or decoded NSP event (dict)
+    alarm:   normalized alarm, when only that is left (batch fallback)
+    source:  (topic, partition, offset) or None
+    """
+    topic, partition, offset = source or (None, None, None)
+    record = {
+        "failed_at": datetime.now(timezone.utc).isoformat(),
+        "stage": stage,
+        "error": f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error),
+        "topic": topic,
+        "partition": partition,
+        "offset": offset,
+    }
+
+    if alarm is not None:
+        record["alarm"] = alarm
+    elif isinstance(payload, dict):
+        record["event"] = payload
+    elif isinstance(payload, bytes):
+        try:
+            record["payload"] = payload.decode()
+        except UnicodeDecodeError:
+            record["payload_b64"] = base64.b64encode(payload).decode()
+    else:
+        record["payload"] = payload
+
+    return record
+
+
+def record_alarm(record, normalize):
+    """
+    Normalized alarm for a record (None if the pipeline drops it).
+    Raises if the record still cannot be decoded / normalized.
+    """
+    if "alarm" in record:
+        return record["alarm"]
+    if "event" in record:
+        return normalize(record["event"])
+    if "payload_b64" in record:
+        return normalize(loads(base64.b64decode(record["payload_b64"])))
+    return normalize(loads(record["payload"]))
+
+
+# -------------------------------
+# Segment files
+# -------------------------------
+def segment_name(directory):
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    return os.path.join(directory, f"dead-{stamp}-{os.getpid()}.jsonl{OPEN_SUFFIX}")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def seal_orphans(directory):
+    """
+    Seal .open segments left behind by a process that no longer runs.
+    """
+    for path in glob.glob(os.path.join(directory, f"*.jsonl{OPEN_SUFFIX}")):
+        try:
+            pid = int(os.path.basename(path).rsplit("-", 1)[1].split(".")[0])
+        except (IndexError, ValueError):
+            continue
+        if pid != os.getpid() and not _pid_alive(pid):
+            os.replace(path, path[: -len(OPEN_SUFFIX)])
+
+
+def sealed_segments(directory=DEAD_LETTER_DIR):
+    return sorted(glob.glob(os.path.join(directory, "*.jsonl")))
+
+
+def read_segment(path):
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def write_segment(records, directory=DEAD_LETTER_DIR):
+    """
+    Write records to a new sealed segment in one go (used by replay).
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = segment_name(directory)
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(dumps(r) + "\n" for r in records)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path, path[: -len(OPEN_SUFFIX)])
+    return path[: -len(OPEN_SUFFIX)]
+
+
+# -------------------------------
+# Background writer
+# -------------------------------
+class DeadLetterWriter:
+    def __init__(self, directory=DEAD_LETTER_DIR, segment_bytes=DEAD_LETTER_SEGMENT_BYTES,
+                 queue_size=DEAD_LETTER_QUEUE_SIZE):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self._file = None
+        self._path = None
+        self._size = 0
+
+    def add(self, stage, error, payload=None, source=None, alarm=None):
+        """
+        Enqueue a dead letter; never blocks the caller.
+        """
+        record = build_record(stage, error, payload, source, alarm)
+        self._ensure_started()
+
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            ERRORS.labels("dead_letter_overflow").inc()
+            log.error("❌ Dead-letter queue full, record lost", extra={"stage": stage, "offset": record["offset"]})
+            return
+
+        DEAD_LETTERS.labels(stage).inc()
+
+    def close(self):
+        """
+        Write everything queued and seal the open segment.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                seal_orphans(self.directory)
+                self._thread = threading.Thread(target=self._run, name="dead-letter-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=DEAD_LETTER_IDLE_SECONDS)
+            except queue.Empty:
+                self._seal()
+                continue
+
+            batch = []
+            stop = record is _STOP
+            if not stop:
+                batch.append(record)
+
+            while not stop and len(batch) < WRITE_BATCH:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stop = True
+                else:
+                    batch.append(record)
+
+            try:
+                if batch:
+                    self._write("".join(dumps(r) + "\n" for r in batch))
+            except Exception:
+                ERRORS.labels("dead_letter_write").inc()
+                log.exception("❌ Dead-letter write failed", extra={"records": len(batch)})
+
+            if stop:
+                self._seal()
+                return
+
+    def _write(self, text):
+        if self._file is None:
+            self._path = segment_name(self.directory)
+            self._file = open(self._path, "a", encoding="utf-8")
+            self._size = 0
+
+        self._file.write(text)
+        self._file.flush()
+        self._size += len(text)
+
+        if self._size >= self.segment_bytes:
+            self._seal()
+
+    def _seal(self):
+        if self._file is None:
+            return
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._path, self._path[: -len(OPEN_SUFFIX)])
+        log.info("📮 Dead-letter segment sealed", extra={"path": self._path[: -len(OPEN_SUFFIX)]})
+        self._file = None
+
+
+# Shared instance for the consumer process
+dead_letters = DeadLetterWriter()
+
+
+# -------------------------------
+# Replay
+# -------------------------------
+def last_written(alarm_ids):
+    """
+    {alarm_id: time of its latest live write} for the given alarms.
+    """
+    from db_pool import get_conn
+
+    if not alarm_ids:
+        return {}
+
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(LAST_WRITTEN_SQL, {"ids": list(alarm_ids)})
+        return dict(cur.fetchall())
+
+
+def drop_superseded(pending):
+    """
+    [(failed_at, alarm), ...] -> (alarms still to replay, skipped count).
+    """
+    written = last_written({alarm["alarm_id"] for _, alarm in pending if alarm.get("alarm_id")})
+    alarms = []
+    skipped = 0
+
+    for failed_at, alarm in pending:
+        live = written.get(alarm.get("alarm_id"))
+        if live is not None and failed_at and live > datetime.fromisoformat(failed_at):
+            skipped += 1
+        else:
+            alarms.append(alarm)
+
+    return alarms, skipped
+
+
+def replay_segment(path, batch_size=REPLAY_BATCH_SIZE, dry_run=False):
+    """
+    Re-drive one sealed segment.
+    Returns (records, alarms written, superseded, still failing).
+    A DB error aborts the segment and leaves it in place.
+    """
+    from alarm_normalizer import normalize_alarm
+    from alarm_lifecycle import handle_alarm_batch
+
+    records = 0
+    pending = []
+    failing = []
+
+    for record in read_segment(path):
+        records += 1
+        try:
+            alarm = record_alarm(record, normalize_alarm)
+        except Exception as e:
+            failing.append({**record, "error": f"{type(e).__name__}: {e}"})
+            continue
+        if alarm:
+            pending.append((record.get("failed_at"), alarm))
+
+    alarms, skipped = drop_superseded(pending)
+
+    if dry_run:
+        return records, len(alarms), skipped, len(failing)
+
+    written = 0
+    for i in range(0, len(alarms), batch_size):
+        written += handle_alarm_batch(alarms[i:i + batch_size])
+
+    if failing:
+        write_segment(failing, os.path.dirname(path))
+    os.replace(path, path + REPLAYED_SUFFIX)
+
+    return records, written, skipped, len(failing)
+
+
+def list_segments(directory):
+    segments = sealed_segments(directory)
+    stages = Counter()
+
+    for path in segments:
+        for record in read_segment(path):
+            stages[record.get("stage")] += 1
+
+    print(f"📮 {len(segments)} sealed segments, {sum(stages.values())} dead letters in {directory}")
+    for stage, count in stages.most_common():
+        print(f"   {stage:<16} {count}")
+
+
+def replay(directory, batch_size, dry_run):
+    from alarm_lifecycle import warm_active_index
+
+    roots = warm_active_index()
+    print(f"🧠 Correlation index warmed: {roots} active root alarms")
+
+    for path in sealed_segments(directory):
+        records, written, skipped, failing = replay_segment(path, batch_size, dry_run)
+        verb = "would write" if dry_run else "wrote"
+        print(
+            f"🔁 {os.path.basename(path)}: {records} records, {verb} {written} alarms, "
+            f"{skipped} superseded by live writes, {failing} still failing"
+        )
+
+
+def main():
+    parser = ArgumentParser("Dead-letter store")
+    parser.add_argument("command", choices=("list", "replay"))
+    parser.add_argument("--dir", default=DEAD_LETTER_DIR)
+    parser.add_argument("--batch-size", type=int, default=REPLAY_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Normalize only, write nothing")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        list_segments(args.dir)
+    else:
+        replay(args.dir, args.batch_size, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
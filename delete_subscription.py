@@ -1,5 +1,8 @@
-import requests
-from configuration import SUBSCRIPTION_URL, VERIFY_SSL
+import logging
+from configuration import SUBSCRIPTION_URL
+from http_session import request
+
+log = logging.getLogger(__name__)
 
 
 def delete_subscription(token_mgr, subscription_id):
@@ -10,6 +13,6 @@ def delete_subscription(token_mgr, subscription_id):
         "Content-Type": "application/json"
     }
 
-    response = requests.delete(url, headers=headers, verify=VERIFY_SSL)
+    response = request("DELETE", url, headers=headers)
     response.raise_for_status()
-    print("🗑️ Subscription deleted")
+    log.info("🗑️ Subscription deleted", extra={"subscription_id": subscription_id})
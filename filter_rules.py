@@ -0,0 +1,192 @@
+"""
+filter_rules.py
+
+Data-driven drop rules, compiled once at load time.
+
+Rules are declared in a JSON file (FILTER_RULES_PATH, default
+filter_rules.json next to this module):
+
+  {"name": ..., "field": ..., "equals": [values]}
+  {"name": ..., "field": ..., "prefix": str|[..], "contains": str, "suffix": str|[..]}
+
+Compilation:
+  - every "equals" rule on a field is merged into ONE dict lookup
+  - every pattern rule on a field is merged into ONE regex alternation
+So evaluation costs one hash lookup + one regex match per field,
+independent of the number of rules. When several rules match, the one
+declared first wins (it is the one counted).
+"""
+
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "filter_rules.json")
+FILTER_RULES_PATH = os.getenv("FILTER_RULES_PATH", DEFAULT_RULES_PATH)
+
+RULE_KEYS = {"name", "description", "field", "equals", "prefix", "contains", "suffix"}
+
+
+class RuleError(ValueError):
+    pass
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def _alternation(values):
+    return "(?:" + "|".join(re.escape(v) for v in values) + ")"
+
+
+def _pattern(rule):
+    """
+    startswith(prefix) AND contains AND endswith(suffix), as lookaheads
+    so the parts may overlap exactly like the str methods allow.
+    """
+    parts = []
+    prefixes = _as_list(rule.get("prefix"))
+    if prefixes:
+        parts.append(f"(?={_alternation(prefixes)})")
+    for needle in _as_list(rule.get("contains")):
+        parts.append(f"(?=.*{re.escape(needle)})")
+    suffixes = _as_list(rule.get("suffix"))
+    if suffixes:
+        parts.append(f"(?=.*{_alternation(suffixes)}\\Z)")
+    return "".join(parts)
+
+
+# -------------------------------
+# Compiled rule set
+# -------------------------------
+class RuleSet:
+    def __init__(self, rules, source=None):
+        self.source = source
+        self.names = []
+        self.hits = Counter()
+
+        self._exact = {}      # field -> {value: rule index}
+        self._patterns = {}   # field -> compiled alternation
+        self._group_rule = {}  # regex group name -> rule index
+
+        pattern_parts = {}
+        first_rule = {}       # field -> index of its first rule
+
+        for index, rule in enumerate(rules):
+            unknown = set(rule) - RULE_KEYS
+            if unknown:
+                raise RuleError(f"rule #{index}: unknown keys {sorted(unknown)}")
+
+            name = rule.get("name")
+            field = rule.get("field")
+            if not name or not field:
+                raise RuleError(f"rule #{index}: 'name' and 'field' are required")
+
+            self.names.append(name)
+            first_rule.setdefault(field, index)
+
+            if "equals" in rule:
+                if any(k in rule for k in ("prefix", "contains", "suffix")):
+                    raise RuleError(f"rule {name!r}: 'equals' cannot be combined with patterns")
+                lookup = self._exact.setdefault(field, {})
+                for value in _as_list(rule["equals"]):
+                    lookup.setdefault(value, index)   # first rule wins
+                continue
+
+            pattern = _pattern(rule)
+            if not pattern:
+                raise RuleError(f"rule {name!r}: needs 'equals' or a prefix/contains/suffix")
+
+            group = f"r{index}"
+            self._group_rule[group] = index
+            pattern_parts.setdefault(field, []).append(f"(?P<{group}>{pattern})")
+
+        for field, parts in pattern_parts.items():
+            self._patterns[field] = re.compile("|".join(parts), re.DOTALL)
+
+        # Fields ordered by their first rule, so matching can stop early
+        self._fields = sorted(
+            ((index, field, self._exact.get(field), self._patterns.get(field))
+             for field, index in first_rule.items()),
+            key=lambda entry: entry[0],
+        )
+        self.fields = [field for _, field, _, _ in self._fields]
+
+    def match(self, fields):
+        """
+        Name of the first declared rule matching `fields` (dict), or None.
+        """
+        best = None
+
+        for first, field, exact, regex in self._fields:
+            if best is not None and best < first:
+                break   # no rule on the remaining fields can win
+
+            value = fields.get(field)
+            if not isinstance(value, str):
+                continue
+
+            if exact is not None:
+                index = exact.get(value)
+                if index is not None and (best is None or index < best):
+                    best = index
+
+            if regex is not None:
+                m = regex.match(value)
+                if m:
+                    index = self._group_rule[m.lastgroup]
+                    if best is None or index < best:
+                        best = index
+
+        if best is None:
+            return None
+
+        name = self.names[best]
+        self.hits[name] += 1
+        return name
+
+    def __len__(self):
+        return len(self.names)
+
+
+# -------------------------------
+# Loading / hot reload
+# -------------------------------
+def load_rules(path=FILTER_RULES_PATH):
+    with open(path, encoding="utf-8") as f:
+        doc = json.load(f)
+    return RuleSet(doc.get("rules", []), source=path)
+
+
+_lock = threading.Lock()
+_ruleset = None
+
+
+def get_rules():
+    """
+    The active rule set (loaded on first use).
+    """
+    global _ruleset
+    if _ruleset is None:
+        with _lock:
+            if _ruleset is None:
+                _ruleset = load_rules()
+    return _ruleset
+
+
+def reload_rules(path=FILTER_RULES_PATH):
+    """
+    Load + compile the rule file and swap it in atomically.
+    On any error the previous rule set stays active and the error is raised.
+    """
+    global _ruleset
+    ruleset = load_rules(path)
+    with _lock:
+        _ruleset = ruleset
+    return ruleset
@@ -0,0 +1,138 @@
+"""
+flap_coalescer.py
+
+Hold-and-collapse buffer for flapping alarms.
+
+Every normalized event is held per alarm_id for FLAP_WINDOW_MS after the
+first event of that alarm arrived. When the window expires, the held
+events are reduced to their net effect and written together by
+handle_alarm_batch: create -> CLEAR -> create becomes one upsert
+instead of an upsert, a history move and another upsert, and a stored
+alarm's CLEAR -> create one upsert instead of a history move and a
+re-insert.
+
+The number of CLEAR -> re-raise bounces collapsed this way is recorded
+on the alarm document as "flap_count". Sequences that end cleared are
+written as-is and are not counted.
+"""
+
+import time
+from collections import OrderedDict
+
+
+def _is_create(alarm):
+    return alarm.get("event_type") == "alarm-create"
+
+
+def _is_clear(alarm):
+    return alarm.get("event_type") == "alarm-change" and alarm.get("severity") == "CLEAR"
+
+
+def count_flaps(alarms):
+    """
+    Number of re-raises that follow a CLEAR within the held events.
+    A CLEAR that opens the window clears the stored raise.
+    """
+    flaps = 0
+    raised = True
+    cleared = False
+
+    for alarm in alarms:
+        if _is_clear(alarm) and raised:
+            cleared = True
+            raised = False
+        elif _is_create(alarm):
+            if cleared:
+                flaps += 1
+                cleared = False
+            raised = True
+
+    return flaps
+
+
+def _net_effect(alarms):
+    """
+    Raised again after the last CLEAR: the alarm never really went away,
+    so only the events after that CLEAR are written (no history row).
+    None if there is no such re-raise (written as-is).
+    """
+    clears = [i for i, alarm in enumerate(alarms) if _is_clear(alarm)]
+    if not clears:
+        return None
+
+    tail = alarms[clears[-1] + 1:]
+    if any(_is_create(alarm) for alarm in tail):
+        return tail
+    return None
+
+
+class FlapCoalescer:
+    def __init__(self, window_ms, clock=time.monotonic):
+        self.window = window_ms / 1000
+        self._clock = clock
+
+        # alarm_id -> (deadline, [alarms], [tokens]); insertion order is
+        # deadline order, since every window has the same length
+        self._pending = OrderedDict()
+
+    def add(self, alarm, token):
+        """
+        Hold `alarm`; `token` is returned with it on release
+        (e.g. the Kafka (topic, partition, offset)).
+        """
+        alarm_id = alarm.get("alarm_id")
+        entry = self._pending.get(alarm_id)
+
+        if entry is None:
+            entry = (self._clock() + self.window, [], [])
+            self._pending[alarm_id] = entry
+
+        entry[1].append(alarm)
+        entry[2].append(token)
+
+    def due(self):
+        """
+        Release every alarm whose window has expired.
+        Returns (alarms, tokens, flaps).
+        """
+        now = self._clock()
+        expired = []
+
+        while self._pending:
+            alarm_id, entry = next(iter(self._pending.items()))
+            if entry[0] > now:
+                break
+            del self._pending[alarm_id]
+            expired.append(entry)
+
+        return self._release(expired)
+
+    def drain(self):
+        """
+        Release everything (shutdown / partition revoke).
+        """
+        expired = list(self._pending.values())
+        self._pending.clear()
+        return self._release(expired)
+
+    def _release(self, entries):
+        alarms = []
+        tokens = []
+        total_flaps = 0
+
+        for _, held, held_tokens in entries:
+            tail = _net_effect(held)
+            if tail is not None:
+                flaps = count_flaps(held)
+                total_flaps += flaps
+                held = [
+                    {**alarm, "flap_count": flaps} if _is_create(alarm) else alarm
+                    for alarm in tail
+                ]
+            alarms.extend(held)
+            tokens.extend(held_tokens)
+
+        return alarms, tokens, total_flaps
+
+    def __len__(self):
+        return len(self._pending)
@@ -2,14 +2,24 @@ import threading
 import signal
 import sys
 import atexit
+import logging
 
-from configuration import USERNAME, PASSWORD
+from requests import HTTPError
+
+from configuration import USERNAME, PASSWORD, RESYNC_PAGE_SIZE
 from token_manager_automatic_refresh import TokenManager
 from create_kafka_subscription import create_subscription
 from renew_subscription import renew_subscription
 from delete_subscription import delete_subscription
 from kafka_consumer import start_kafka_consumer
+from alarm_resync import resync_active_alarms
+from offset_store import consumed_offsets, load_subscription, save_subscription
 from revoke_token import revoke_token
+from structured_logging import setup_logging, shutdown_logging
+from filter_rules import reload_rules
+from metrics import RULE_RELOADS
+
+log = logging.getLogger(__name__)
 
 
 # -------------------------------
@@ -32,20 +42,24 @@ def cleanup():
         return
     cleanup_done = True
 
-    print("\n🧹 Cleaning up NSP resources...")
+    log.info("🧹 Cleaning up NSP resources...")
     stop_event.set()
 
-    if subscription_id:
+    # With stored offsets the subscription is kept (and reused on
+    # restart): deleting it would delete its topic and the backlog
+    if subscription_id and not consumed_offsets.enabled:
         try:
             delete_subscription(token_mgr, subscription_id)
         except Exception as e:
-            print("⚠️ Failed to delete subscription:", e)
+            log.warning("⚠️ Failed to delete subscription: %s", e)
 
     if token_mgr and token_mgr.access_token:
         try:
             revoke_token(token_mgr.access_token)
         except Exception as e:
-            print("⚠️ Failed to revoke token:", e)
+            log.warning("⚠️ Failed to revoke token: %s", e)
+
+    shutdown_logging()
 
 
 # -------------------------------
@@ -53,18 +67,72 @@ def cleanup():
 # -------------------------------
 
 def shutdown_handler(sig, frame):
-    print("\n🛑 Shutdown signal received")
+    log.info("🛑 Shutdown signal received", extra={"signal": sig})
     cleanup()
     sys.exit(0)
 
 
+def reload_handler(sig, frame):
+    """
+    SIGHUP: recompile filter_rules.json without touching the Kafka session.
+    """
+    try:
+        rules = reload_rules()
+    except Exception:
+        RULE_RELOADS.labels("failed").inc()
+        log.exception("❌ Filter rule reload failed, keeping previous rules")
+        return
+
+    RULE_RELOADS.labels("ok").inc()
+    log.info("🔄 Filter rules reloaded", extra={"rules": len(rules), "path": rules.source})
+
+
 signal.signal(signal.SIGINT, shutdown_handler)
 signal.signal(signal.SIGTERM, shutdown_handler)
+signal.signal(signal.SIGHUP, reload_handler)
 
 # ✅ Run cleanup even on unhandled exception
 atexit.register(cleanup)
 
 
+# -------------------------------
+# Subscription reuse
+# -------------------------------
+
+# Renewal answers for a subscription NSP no longer has
+SUBSCRIPTION_GONE = (400, 404, 410)
+
+
+def open_subscription(token_mgr):
+    """
+    Reuse the stored subscription (its topic is what the stored offsets
+    refer to) while NSP still has it; else create and store a new one.
+    """
+    if not consumed_offsets.enabled:
+        return create_subscription(token_mgr)
+
+    stored = load_subscription()
+    if stored:
+        subscription_id, topic_id = stored
+        try:
+            renew_subscription(token_mgr, subscription_id)
+            log.info("♻️ Reusing subscription", extra={"subscription_id": subscription_id, "topic": topic_id})
+            return subscription_id, topic_id
+        except HTTPError as e:
+            if e.response is None or e.response.status_code not in SUBSCRIPTION_GONE:
+                raise
+            log.warning(
+                "⚠️ Stored subscription is gone, creating a new one (its offsets are dropped)",
+                extra={"subscription_id": subscription_id, "status": e.response.status_code},
+            )
+
+    subscription_id, topic_id = create_subscription(token_mgr)
+    stale = save_subscription(subscription_id, topic_id)
+    if stale:
+        log.info("🧹 Offsets of old topics removed", extra={"rows": stale})
+    return subscription_id, topic_id
+
+
 # -------------------------------
 # Auto-renew thread
 # -------------------------------
@@ -73,9 +141,9 @@ def auto_renew_subscription(token_mgr, subscription_id, stop_event, interval=180
     while not stop_event.wait(interval):
         try:
             renew_subscription(token_mgr, subscription_id)
-            print("🔁 Subscription renewed")
+            log.info("🔁 Subscription renewed")
         except Exception as e:
-            print("❌ Subscription renewal failed:", e)
+            log.error("❌ Subscription renewal failed: %s", e)
 
 
 # -------------------------------
@@ -84,10 +152,13 @@ def auto_renew_subscription(token_mgr, subscription_id, stop_event, interval=180
 
 if __name__ == "__main__":
 
+    setup_logging()
+
     try:
         token_mgr = TokenManager(USERNAME, PASSWORD)
+        token_mgr.start_refresher(stop_event)
 
-        subscription_id, topic_id = create_subscription(token_mgr)
+        subscription_id, topic_id = open_subscription(token_mgr)
 
         threading.Thread(
             target=auto_renew_subscription,
@@ -95,9 +166,16 @@ if __name__ == "__main__":
             daemon=True
         ).start()
 
+        # Subscribed first, so nothing raised during the resync is missed
+        if RESYNC_PAGE_SIZE:
+            try:
+                resync_active_alarms(token_mgr)
+            except Exception:
+                log.exception("❌ Active alarm resync failed, consuming without it")
+
         start_kafka_consumer(topic_id, stop_event)
 
     except Exception as e:
-        print("❌ Fatal error:", e)
+        log.exception("❌ Fatal error: %s", e)
         cleanup()
         sys.exit(1)
@@ -0,0 +1,61 @@
+"""
+http_session.py
+
+One pooled keep-alive requests.Session for every NSP control-plane
+call (auth, subscription create / renew / delete, revoke, resync), so
+calls reuse the TLS connection instead of handshaking each time.
+
+Transient failures are retried with exponential backoff: connection
+errors for every method, 502 / 503 / 504 from the gateway only for
+idempotent methods. A gateway error or read timeout can come back after
+the upstream applied the request, so POSTs (token, subscription create,
+renew, revoke) are not retried then: a retried create could leave a
+duplicate subscription.
+"""
+
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from configuration import VERIFY_SSL
+
+HTTP_TIMEOUT_SECONDS = float(os.getenv("NSP_HTTP_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.getenv("NSP_HTTP_RETRIES", "3"))
+HTTP_BACKOFF_SECONDS = 0.5   # 0.5 s, 1 s, 2 s, ...
+HTTP_POOL_SIZE = 4
+
+# Status retries only; connect errors are retried for any method
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+
+
+def build_session():
+    retry = Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=0,
+        status=HTTP_RETRIES,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=IDEMPOTENT_METHODS,
+        backoff_factor=HTTP_BACKOFF_SECONDS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.verify = VERIFY_SSL
+    return session
+
+
+session = build_session()
+
+
+def request(method, url, **kwargs):
+    """
+    session.request() with the default timeout.
+    """
+    kwargs.setdefault("timeout", HTTP_TIMEOUT_SECONDS)
+    return session.request(method, url, **kwargs)
@@ -1,18 +1,67 @@
-import json
-import socket
-import traceback
-from confluent_kafka import Consumer
+import logging
+import time
+from confluent_kafka import Consumer, KafkaError, KafkaException, TopicPartition
 
-from configuration import NSP_SERVER, KAFKA_KEYSTORE_PASSWORD
-from alarm_normalizer import normalize_alarm
-from alarm_lifecycle import handle_alarm_lifecycle
+from configuration import (
+    NSP_SERVER,
+    KAFKA_KEYSTORE_PASSWORD,
+    KAFKA_GROUP_ID,
+    CONSUMER_MODE,
+    BATCH_SIZE,
+    BATCH_TIMEOUT_MS,
+    WORKER_COUNT,
+    WORKER_QUEUE_SIZE,
+    QUEUE_HIGH_WATER,
+    QUEUE_LOW_WATER,
+    COMMIT_INTERVAL_MS,
+    FLAP_WINDOW_MS,
+    CHILD_HOLD_MS,
+)
+from alarm_normalizer import normalize_alarm, event_alarm_id
+from alarm_lifecycle import (
+    handle_alarm_lifecycle,
+    handle_alarm_batch,
+    warm_active_index,
+)
+from active_alarm_index import active_index, active_children, is_root
+from codec import loads, encode
+from db_pool import db_pool
+from offset_store import consumed_offsets, OffsetLoadError
+from worker_pool import OffsetTracker, ShardedWorkerPool, Backpressure
+from flap_coalescer import FlapCoalescer
+from child_hold import ChildHoldBuffer
+from dead_letters import dead_letters
+from structured_logging import ALARM_LOGGER
+from filter_rules import get_rules
+from correlation_rules import get_correlation_rules
+from metrics import (
+    MESSAGES_CONSUMED,
+    ERRORS,
+    STAGE_LATENCY,
+    ALARMS_KEPT,
+    DROPS,
+    FLAPS_COALESCED,
+    WRITER_BACKLOG,
+    KAFKA_PAUSED,
+    KAFKA_PAUSED_SECONDS,
+    METRICS_PORT,
+    METRICS_STATS_INTERVAL_MS,
+    kafka_stats_cb,
+    start_metrics_server,
+)
 
+log = logging.getLogger(__name__)
+alarm_log = logging.getLogger(ALARM_LOGGER)
 
-def start_kafka_consumer(topic, stop_event):
+
+def build_consumer_conf():
     conf = {
         "bootstrap.servers": f"{NSP_SERVER}:9193",
-        "group.id": f"nsp-python-{socket.gethostname()}",
-        "auto.offset.reset": "latest",
+        "group.id": KAFKA_GROUP_ID,
+        # The topic is created per subscription, so "earliest" means
+        # "since subscribing": events raised during the startup resync
+        # are not skipped
+        "auto.offset.reset": "earliest",
 
         "security.protocol": "SSL",
         "ssl.keystore.location": "nsp_keystore.p12",
@@ -20,67 +69,606 @@ def start_kafka_consumer(topic, stop_event):
         "ssl.ca.location": "ca.pem",
     }
 
-    consumer = Consumer(conf)
-    consumer.subscribe([topic])
+    if CONSUMER_MODE in ("batch", "parallel") or FLAP_WINDOW_MS > 0 or CHILD_HOLD_MS > 0:
+        # Offsets are committed only after the DB transaction commits
+        conf["enable.auto.commit"] = False
+
+    if METRICS_PORT:
+        # Consumer lag per partition comes from librdkafka statistics
+        conf["statistics.interval.ms"] = METRICS_STATS_INTERVAL_MS
+        conf["stats_cb"] = kafka_stats_cb
+
+    return conf
+
+
+def start_kafka_consumer(topic, stop_event):
+    if start_metrics_server():
+        log.info("📈 Metrics endpoint started", extra={"port": METRICS_PORT})
+
+    # Fail fast on a broken rule file
+    rules = get_rules()
+    log.info("📜 Filter rules loaded", extra={"rules": len(rules), "path": rules.source})
+    correlation = get_correlation_rules()
+    log.info("🔗 Correlation rules loaded", extra={"rules": len(correlation), "path": correlation.source})
+
+    # Warm correlation index once, before the first message
+    roots = warm_active_index()
+    log.info("🧠 Correlation index warmed", extra={"roots": roots, "children": len(active_children)})
+
+    consumer = Consumer(build_consumer_conf())
 
-    print("📡 Kafka consumer started")
-    print(f"📥 Subscribed to topic: {topic}")
+    log.info("📡 Kafka consumer started", extra={"topic": topic, "mode": CONSUMER_MODE})
+
+    try:
+        if CONSUMER_MODE == "batch":
+            log.info("📦 Batch mode", extra={"batch_size": BATCH_SIZE, "batch_timeout_ms": BATCH_TIMEOUT_MS})
+            run_batch_loop(consumer, topic, stop_event)
+        elif CONSUMER_MODE == "parallel":
+            log.info("🧵 Parallel mode, sharded by alarm_id", extra={"workers": WORKER_COUNT})
+            run_parallel_loop(consumer, topic, stop_event)
+        elif FLAP_WINDOW_MS > 0 or CHILD_HOLD_MS > 0:
+            log.info("🔁 Flap coalescing / child hold", extra={"window_ms": FLAP_WINDOW_MS, "child_hold_ms": CHILD_HOLD_MS})
+            run_coalescing_loop(consumer, topic, stop_event)
+        else:
+            run_single_loop(consumer, topic, stop_event)
+
+    finally:
+        consumer.close()
+        dead_letters.close()
+        db_pool.closeall()
+        log.info("🛑 Kafka consumer stopped")
+
+
+# -------------------------------
+# Per-event pipeline
+# -------------------------------
+def decode_message(msg):
+    """
+    Kafka message -> event dict, or None if it is an error / not JSON.
+    """
+    if msg.error():
+        ERRORS.labels("kafka").inc()
+        log.error("❌ Kafka error: %s", msg.error())
+        return None
+
+    MESSAGES_CONSUMED.inc()
+
+    # ---------------------------
+    # Decode message safely
+    # ---------------------------
+    started = time.perf_counter()
+    try:
+        return loads(msg.value())
+    except Exception as e:
+        ERRORS.labels("invalid_json").inc()
+        log.warning("❌ Invalid JSON from Kafka: %s", e)
+        dead_letters.add("invalid_json", e, msg.value(), message_source(msg))
+        return None
+    finally:
+        STAGE_LATENCY.labels("decode").observe(time.perf_counter() - started)
+
+
+def message_source(msg):
+    return msg.topic(), msg.partition(), msg.offset()
+
+
+def timed_normalize(event, source=None):
+    """
+    normalize_alarm() with latency / error accounting. None on failure
+    (the event is dead-lettered).
+    """
+    started = time.perf_counter()
+    try:
+        return normalize_alarm(event)
+    except Exception as e:
+        ERRORS.labels("normalize").inc()
+        log.exception("❌ normalize_alarm() failed")
+        dead_letters.add("normalize", e, event, source)
+        return None
+    finally:
+        STAGE_LATENCY.labels("normalize").observe(time.perf_counter() - started)
+
+
+def process_event(event, offsets=None, source=None):
+    """
+    normalize -> filter -> lifecycle -> log for one decoded event.
+    Failures are reported and the event is dead-lettered.
+    Returns True if `offsets` were stored with a DB write.
+    """
+    # ---------------------------
+    # Normalize alarm safely
+    # ---------------------------
+    alarm = timed_normalize(event, source)
+
+    if not alarm:
+        return False
+
+    ALARMS_KEPT.inc()
+
+    # ---------------------------
+    # Handle lifecycle SAFELY
+    # ---------------------------
+    # Serialized once: the same text is bound to SQL and logged
+    payload = encode(alarm)
+
+    started = time.perf_counter()
+    try:
+        written = handle_alarm_lifecycle(alarm, payload, offsets)
+    except Exception as e:
+        ERRORS.labels("lifecycle").inc()
+        log.exception("❌ handle_alarm_lifecycle() failed", extra={"alarm_id": alarm.get("alarm_id")})
+        dead_letters.add("lifecycle", e, event, source)
+        return False
+    finally:
+        STAGE_LATENCY.labels("lifecycle").observe(time.perf_counter() - started)
+
+    # ---------------------------
+    # Log alarm (non-fatal)
+    # ---------------------------
+    alarm_log.info(
+        "🔄 ALARM CHANGE" if alarm.get("changes") else "🚨 REAL ALARM",
+        extra={"alarm": payload},
+    )
+    return written
+
+
+# -------------------------------
+# Single-message mode
+# -------------------------------
+def subscribe(consumer, topic, on_revoke):
+    """
+    Subscribe, starting assigned partitions at their stored offsets.
+    """
+    consumer.subscribe(
+        [topic],
+        on_assign=consumed_offsets.seek_assigned,
+        on_revoke=on_revoke,
+    )
+
+
+def handle_message(msg):
+    """
+    One message in single mode; its offset is stored with the alarm write.
+    """
+    event = decode_message(msg)
+
+    if msg.error():
+        return
+
+    consumed_offsets.mark(msg.topic(), msg.partition(), msg.offset())
+
+    if event is None:
+        return
+
+    offsets = consumed_offsets.pending()
+    if process_event(event, offsets, message_source(msg)):
+        consumed_offsets.stored(offsets)
+
+
+def run_single_loop(consumer, topic, stop_event):
+    def on_revoke(consumer, partitions):
+        # Store offsets of skipped messages before losing the partitions
+        consumed_offsets.flush()
+        consumed_offsets.forget([(p.topic, p.partition) for p in partitions])
+
+    subscribe(consumer, topic, on_revoke)
+
+    next_flush = time.monotonic() + COMMIT_INTERVAL_MS / 1000
 
     try:
         while not stop_event.is_set():
             try:
                 msg = consumer.poll(1.0)
 
-                if msg is None:
-                    continue
-
-                if msg.error():
-                    print("❌ Kafka error:", msg.error())
-                    continue
-
-                # ---------------------------
-                # Decode message safely
-                # ---------------------------
-                try:
-                    event = json.loads(msg.value().decode())
-                except Exception as e:
-                    print("❌ Invalid JSON from Kafka:", e)
-                    continue
-
-                # ---------------------------
-                # Normalize alarm safely
-                # ---------------------------
-                try:
-                    alarm = normalize_alarm(event)
-                except Exception:
-                    print("❌ normalize_alarm() failed")
-                    traceback.print_exc()
-                    continue
-
-                if not alarm:
-                    continue
-
-                # ---------------------------
-                # Handle lifecycle SAFELY
-                # ---------------------------
-                try:
-                    handle_alarm_lifecycle(alarm)
-                except Exception:
-                    print("❌ handle_alarm_lifecycle() failed")
-                    traceback.print_exc()
-                    continue
-
-                # ---------------------------
-                # Log alarm (non-fatal)
-                # ---------------------------
-                print("\n🚨 REAL ALARM")
-                print(json.dumps(alarm, indent=2, default=str))
+                if msg is not None:
+                    handle_message(msg)
+
+                if time.monotonic() >= next_flush:
+                    consumed_offsets.flush()
+                    next_flush = time.monotonic() + COMMIT_INTERVAL_MS / 1000
 
+            except OffsetLoadError:
+                raise
             except Exception:
                 # Absolute last-resort guard
-                print("❌ Unexpected consumer loop error")
-                traceback.print_exc()
+                ERRORS.labels("loop").inc()
+                log.exception("❌ Unexpected consumer loop error")
 
     finally:
-        consumer.close()
-        print("🛑 Kafka consumer stopped")
+        try:
+            consumed_offsets.flush()
+        except Exception:
+            log.exception("❌ Final offset store failed")
+
+
+# -------------------------------
+# Single mode with flap coalescing / child hold
+# -------------------------------
+def hold_message(msg, coalescer, tracker, held=None):
+    """
+    Decode + normalize on arrival and hold the alarm in the coalescer,
+    or in `held` (ChildHoldBuffer) if it may be a correlation child.
+    A root drops the held children it correlates with.
+    Messages with nothing to write are finished immediately.
+    """
+    event = decode_message(msg)
+
+    if msg.error():
+        return
+
+    topic, partition, offset = msg.topic(), msg.partition(), msg.offset()
+    tracker.dispatched(topic, partition, offset)
+
+    alarm = timed_normalize(event, (topic, partition, offset)) if event is not None else None
+
+    if not alarm or not alarm.get("alarm_id"):
+        tracker.finished(topic, partition, offset)
+        return
+
+    ALARMS_KEPT.inc()
+    _stage_root_alarm(alarm)
+
+    if held is not None:
+        if is_root(alarm):
+            suppress_held(held, tracker)
+        if held.holds(alarm):
+            held.add(alarm, (topic, partition, offset))
+            return
+
+    coalescer.add(alarm, (topic, partition, offset))
+
+
+def suppress_held(held, tracker):
+    rules, tokens = held.suppress(active_index)
+
+    for rule in rules:
+        DROPS.labels(rule).inc()
+    for topic, partition, offset in tokens:
+        tracker.finished(topic, partition, offset)
+
+
+def flush_coalesced(released, tracker):
+    alarms, tokens, flaps = released
+
+    if alarms:
+        write_batch(alarms)
+    if flaps:
+        FLAPS_COALESCED.inc(flaps)
+        log.debug("🔁 Flaps coalesced", extra={"flaps": flaps, "alarms": len(alarms)})
+
+    for topic, partition, offset in tokens:
+        tracker.finished(topic, partition, offset)
+
+
+def run_coalescing_loop(consumer, topic, stop_event):
+    tracker = OffsetTracker()
+    coalescer = FlapCoalescer(FLAP_WINDOW_MS)
+
+    # Never shorter than the flap window: events of an alarm that moved
+    # to the child hold must be released after its earlier ones
+    held = ChildHoldBuffer(max(CHILD_HOLD_MS, FLAP_WINDOW_MS)) if CHILD_HOLD_MS > 0 else None
+
+    def release_due():
+        flush_coalesced(coalescer.due(), tracker)
+        if held is not None:
+            flush_coalesced(held.due(), tracker)
+
+    def release_all():
+        flush_coalesced(coalescer.drain(), tracker)
+        if held is not None:
+            flush_coalesced(held.drain(), tracker)
+
+    def on_revoke(consumer, partitions):
+        # Write everything held and commit before losing the partitions
+        release_all()
+        commit_tracked_offsets(consumer, tracker)
+        tracker.forget([(p.topic, p.partition) for p in partitions])
+
+    subscribe(consumer, topic, on_revoke)
+
+    next_commit = time.monotonic() + COMMIT_INTERVAL_MS / 1000
+
+    try:
+        while not stop_event.is_set():
+            try:
+                msg = consumer.poll(0.05)
+
+                if msg is not None:
+                    hold_message(msg, coalescer, tracker, held)
+
+                release_due()
+
+                if time.monotonic() >= next_commit:
+                    commit_tracked_offsets(consumer, tracker)
+                    next_commit = time.monotonic() + COMMIT_INTERVAL_MS / 1000
+
+            except OffsetLoadError:
+                raise
+            except Exception:
+                # Absolute last-resort guard
+                ERRORS.labels("loop").inc()
+                log.exception("❌ Unexpected consumer loop error")
+
+    finally:
+        try:
+            release_all()
+            commit_tracked_offsets(consumer, tracker)
+        except Exception:
+            log.exception("❌ Final flush / offset commit failed")
+
+
+# -------------------------------
+# Micro-batch mode
+# -------------------------------
+# alarm_id -> root indexed before it was staged (None = not indexed),
+# restored by settle_staged() if the staged write fails
+_staged = {}
+
+
+def _stage_root_alarm(alarm):
+    """
+    Make a root alarm visible to correlation for the rest of the batch,
+    as it would be in single mode. Re-applied after the DB commit,
+    reverted if the write fails (see settle_staged).
+    """
+    alarm_id = alarm.get("alarm_id")
+
+    if alarm.get("event_type") == "alarm-change" and alarm.get("severity") == "CLEAR":
+        previous = active_index.get(alarm_id)
+        if previous is not None:
+            _staged.setdefault(alarm_id, previous)
+            active_index.remove(alarm_id)
+    elif is_root(alarm):
+        _staged.setdefault(alarm_id, active_index.get(alarm_id))
+        active_index.upsert(alarm)
+
+
+def settle_staged(alarms, failed=()):
+    """
+    The write of `alarms` is done: keep what was staged for them, except
+    for the alarm_ids in `failed`, which get their previous index entry
+    back (a root never stored must not suppress children, a root whose
+    CLEAR failed must keep correlating).
+    """
+    for alarm in alarms:
+        alarm_id = alarm.get("alarm_id")
+        if alarm_id not in _staged:
+            continue
+
+        previous = _staged.pop(alarm_id)
+        if alarm_id not in failed:
+            continue
+        if previous is None:
+            active_index.remove(alarm_id)
+        else:
+            active_index.upsert(previous)
+
+
+def normalize_batch(messages):
+    """
+    Decode + normalize a batch of Kafka messages, in order.
+    Undecodable or failing messages are reported and skipped.
+    """
+    alarms = []
+
+    for msg in messages:
+        event = decode_message(msg)
+        if event is None:
+            continue
+
+        alarm = timed_normalize(event, message_source(msg))
+        if not alarm:
+            continue
+
+        ALARMS_KEPT.inc()
+        _stage_root_alarm(alarm)
+        alarms.append(alarm)
+
+    return alarms
+
+
+def write_batch(alarms, offsets=None):
+    """
+    Write the batch in one transaction. If the batch transaction fails,
+    fall back to per-alarm handling so one bad alarm cannot block the rest.
+    Returns True if `offsets` were stored with the batch.
+    """
+    started = time.perf_counter()
+    try:
+        written = handle_alarm_batch(alarms, offsets) > 0
+        settle_staged(alarms)
+        return written
+    except Exception:
+        ERRORS.labels("batch").inc()
+        log.exception("❌ handle_alarm_batch() failed, retrying one by one", extra={"alarms": len(alarms)})
+    finally:
+        STAGE_LATENCY.labels("lifecycle_batch").observe(time.perf_counter() - started)
+
+    # Outcome of the last event per alarm_id decides what stays staged
+    ok = {}
+    for alarm in alarms:
+        try:
+            handle_alarm_lifecycle(alarm)
+            ok[alarm.get("alarm_id")] = True
+        except Exception as e:
+            ok[alarm.get("alarm_id")] = False
+            ERRORS.labels("lifecycle").inc()
+            log.exception("❌ handle_alarm_lifecycle() failed", extra={"alarm_id": alarm.get("alarm_id")})
+            dead_letters.add("lifecycle", e, alarm=alarm)
+
+    settle_staged(alarms, {alarm_id for alarm_id, written in ok.items() if not written})
+    return False
+
+
+def commit_offsets(consumer):
+    try:
+        consumer.commit(asynchronous=False)
+    except KafkaException as e:
+        # Nothing consumed since the last commit (e.g. only error events)
+        if e.args[0].code() != KafkaError._NO_OFFSET:
+            raise
+
+
+def run_batch_loop(consumer, topic, stop_event):
+    def on_revoke(consumer, partitions):
+        consumed_offsets.forget([(p.topic, p.partition) for p in partitions])
+
+    subscribe(consumer, topic, on_revoke)
+
+    while not stop_event.is_set():
+        try:
+            messages = consumer.consume(
+                num_messages=BATCH_SIZE,
+                timeout=BATCH_TIMEOUT_MS / 1000,
+            )
+
+            if not messages:
+                continue
+
+            started = time.monotonic()
+            alarms = normalize_batch(messages)
+
+            for msg in messages:
+                if not msg.error():
+                    consumed_offsets.mark(msg.topic(), msg.partition(), msg.offset())
+            offsets = consumed_offsets.pending()
+
+            # Offsets go into the batch transaction; a batch with nothing
+            # to write (or written one by one) stores them on their own
+            if alarms and write_batch(alarms, offsets):
+                consumed_offsets.stored(offsets)
+            else:
+                consumed_offsets.save(offsets)
+
+            # Kafka offsets only after the DB commit
+            commit_offsets(consumer)
+
+            if alarms:
+                log.debug(
+                    "📦 Batch written",
+                    extra={
+                        "messages": len(messages),
+                        "alarms": len(alarms),
+                        "elapsed_ms": round((time.monotonic() - started) * 1000),
+                    },
+                )
+
+        except OffsetLoadError:
+            raise
+        except Exception:
+            # Absolute last-resort guard
+            ERRORS.labels("loop").inc()
+            log.exception("❌ Unexpected consumer loop error")
+
+
+# -------------------------------
+# Parallel mode (sharded by alarm_id)
+# -------------------------------
+def commit_tracked_offsets(consumer, tracker):
+    """
+    Store the contiguous finished offsets in Postgres, then in Kafka.
+    """
+    committable = tracker.committable()
+    consumed_offsets.save(committable)
+
+    offsets = [
+        TopicPartition(topic, partition, offset)
+        for (topic, partition), offset in committable.items()
+    ]
+    if offsets:
+        consumer.commit(offsets=offsets, asynchronous=False)
+
+
+def update_backpressure(gate, pool):
+    backlog = pool.backlog()
+    WRITER_BACKLOG.set(backlog)
+
+    was_paused = gate.paused
+    KAFKA_PAUSED_SECONDS.inc(gate.update(backlog))
+
+    if gate.paused != was_paused:
+        KAFKA_PAUSED.set(1 if gate.paused else 0)
+        log.info(
+            "⏸️ Intake paused, writers behind" if gate.paused else "▶️ Intake resumed",
+            extra={"backlog": backlog},
+        )
+
+
+def run_parallel_loop(consumer, topic, stop_event):
+    tracker = OffsetTracker()
+    pool = ShardedWorkerPool(WORKER_COUNT, process_dispatched, tracker, WORKER_QUEUE_SIZE)
+
+    # Paused partitions are not fetched, but poll() keeps running, so the
+    # group session and rebalance callbacks stay alive during a DB slowdown
+    gate = Backpressure(
+        QUEUE_HIGH_WATER,
+        QUEUE_LOW_WATER,
+        pause=lambda: consumer.pause(consumer.assignment()),
+        resume=lambda: consumer.resume(consumer.assignment()),
+    )
+
+    def on_revoke(consumer, partitions):
+        # Finish in-flight work and commit before losing the partitions
+        pool.drain()
+        commit_tracked_offsets(consumer, tracker)
+        tracker.forget([(p.topic, p.partition) for p in partitions])
+        KAFKA_PAUSED_SECONDS.inc(gate.release())
+        KAFKA_PAUSED.set(0)
+
+    subscribe(consumer, topic, on_revoke)
+    pool.start()
+
+    next_commit = time.monotonic() + COMMIT_INTERVAL_MS / 1000
+
+    try:
+        while not stop_event.is_set():
+            try:
+                msg = consumer.poll(0.1)
+
+                if msg is not None:
+                    dispatch_message(msg, pool, tracker)
+
+                update_backpressure(gate, pool)
+
+                if time.monotonic() >= next_commit:
+                    commit_tracked_offsets(consumer, tracker)
+                    next_commit = time.monotonic() + COMMIT_INTERVAL_MS / 1000
+
+            except OffsetLoadError:
+                raise
+            except Exception:
+                # Absolute last-resort guard
+                ERRORS.labels("loop").inc()
+                log.exception("❌ Unexpected consumer loop error")
+
+    finally:
+        pool.stop()
+        try:
+            commit_tracked_offsets(consumer, tracker)
+        except Exception:
+            log.exception("❌ Final offset commit failed")
+
+
+def dispatch_message(msg, pool, tracker):
+    """
+    Decode on the consumer thread and hand the event to its alarm's worker.
+    Messages that cannot be routed are finished immediately.
+    """
+    event = decode_message(msg)
+
+    if msg.error():
+        return
+
+    topic, partition, offset = msg.topic(), msg.partition(), msg.offset()
+
+    if not isinstance(event, dict):
+        tracker.dispatched(topic, partition, offset)
+        tracker.finished(topic, partition, offset)
+        return
+
+    pool.submit(event_alarm_id(event), topic, partition, offset, (event, (topic, partition, offset)))
+
+
+def process_dispatched(item):
+    event, source = item
+    process_event(event, source=source)
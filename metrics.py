@@ -0,0 +1,279 @@
+"""
+metrics.py
+
+In-process metrics with a local HTTP endpoint in Prometheus text format.
+
+Dependency-free (stdlib only): counters, gauges and histograms with
+labels, rendered on GET /metrics by a background HTTP server thread.
+
+Environment:
+  METRICS_HOST               bind address (default 127.0.0.1)
+  METRICS_PORT               port (default 9108, 0 = disabled)
+  METRICS_STATS_INTERVAL_MS  librdkafka statistics interval for lag
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_STATS_INTERVAL_MS = int(os.getenv("METRICS_STATS_INTERVAL_MS", "15000"))
+
+# Seconds; tuned for sub-millisecond filter calls up to multi-second DB stalls
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+_REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+# -------------------------------
+# Metric types
+# -------------------------------
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self.labels()   # export unlabelled metrics from zero
+        _REGISTRY.append(self)
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_label_str(labelnames, key)} {self.value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(tuple(str(v) for v in values), None)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last = +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def render(self, name, labelnames, key):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_label_str(labelnames, key, [('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_label_str(labelnames, key)} {self.sum}")
+        lines.append(f"{name}_count{_label_str(labelnames, key)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+def render_all():
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------------
+# Pipeline metrics
+# -------------------------------
+MESSAGES_CONSUMED = Counter(
+    "nsp_messages_consumed_total", "Kafka messages consumed"
+)
+ERRORS = Counter(
+    "nsp_errors_total", "Pipeline errors by type", ["type"]
+)
+STAGE_LATENCY = Histogram(
+    "nsp_stage_latency_seconds", "Per-stage processing latency", ["stage"]
+)
+DROPS = Counter(
+    "nsp_alarms_dropped_total", "Alarms dropped by filter rule", ["rule"]
+)
+RULE_RELOADS = Counter(
+    "nsp_filter_rule_reloads_total", "Filter rule reloads (SIGHUP)", ["result"]
+)
+FLAPS_COALESCED = Counter(
+    "nsp_alarm_flaps_coalesced_total", "Raise/CLEAR flaps collapsed before writing"
+)
+CHILDREN_RETRACTED = Counter(
+    "nsp_alarm_children_retracted_total", "Stored child alarms deleted when their root arrived", ["rule"]
+)
+UPSERTS_SKIPPED = Counter(
+    "nsp_upserts_skipped_total", "Re-sent unchanged alarm-create events not written"
+)
+DEAD_LETTERS = Counter(
+    "nsp_dead_letters_total", "Messages written to the dead-letter store", ["stage"]
+)
+ALARMS_KEPT = Counter(
+    "nsp_alarms_kept_total", "Alarms that passed the filter"
+)
+DB_ROUND_TRIP = Histogram(
+    "nsp_db_round_trip_seconds", "Postgres statement round-trip time"
+)
+WRITER_BACKLOG = Gauge(
+    "nsp_writer_backlog", "Events queued for the fullest DB writer (parallel mode)"
+)
+KAFKA_PAUSED = Gauge(
+    "nsp_kafka_paused", "1 while intake is paused by backpressure"
+)
+KAFKA_PAUSED_SECONDS = Counter(
+    "nsp_kafka_paused_seconds_total", "Time intake spent paused by backpressure"
+)
+CONSUMER_LAG = Gauge(
+    "nsp_kafka_consumer_lag", "Kafka consumer lag per partition", ["topic", "partition"]
+)
+
+
+def kafka_stats_cb(stats_json):
+    """
+    confluent_kafka stats_cb: export consumer lag per partition.
+    """
+    try:
+        stats = json.loads(stats_json)
+    except ValueError:
+        return
+
+    for topic, tstats in stats.get("topics", {}).items():
+        for partition, pstats in tstats.get("partitions", {}).items():
+            if partition == "-1":
+                continue  # internal UA partition
+            lag = pstats.get("consumer_lag", -1)
+            if lag >= 0:
+                CONSUMER_LAG.labels(topic, partition).set(lag)
+
+
+# -------------------------------
+# HTTP endpoint
+# -------------------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = render_all().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # keep scrapes out of the service log
+
+
+_server = None
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Serve /metrics on a daemon thread. Idempotent; port 0 disables it.
+    """
+    global _server
+    if _server is not None or not port:
+        return _server
+
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    _server.daemon_threads = True
+    threading.Thread(
+        target=_server.serve_forever, name="metrics-http", daemon=True
+    ).start()
+    return _server
@@ -0,0 +1,158 @@
+-- ===============================
+-- 001: typed, indexed alarm columns
+-- ===============================
+-- Hot attributes are promoted out of the JSONB document into real
+-- columns, kept in sync by a BEFORE INSERT / UPDATE OF alarm trigger,
+-- so filters and correlation lookups use btree indexes instead of
+-- alarm->>'...' scans. The whole-document GIN indexes are dropped: no
+-- query uses them and they made every upsert expensive.
+--
+-- Idempotent: safe to re-run (bootstrap_postgres_nsp.sh applies all
+-- migrations on every run).
+
+-- -------------------------------
+-- Helpers (IMMUTABLE: usable in backfill, trigger and indexes)
+-- -------------------------------
+
+-- ISO 8601 with offset -> timestamptz; NULL for missing / malformed
+CREATE OR REPLACE FUNCTION alarm_ts(value TEXT)
+RETURNS TIMESTAMPTZ AS $$
+    SELECT CASE
+        WHEN value ~ '^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})$'
+        THEN value::timestamptz
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Same as alarm_filters.extract_ops_span():
+--   Benapole/OPS-3-7-A3,OCH,RCV -> OPS-3-7
+CREATE OR REPLACE FUNCTION alarm_ops_span(name TEXT)
+RETURNS TEXT AS $$
+    SELECT substring(name FROM '(?:^|/)(OPS-[^/-]*(?:-[^/-]*)?)');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- -------------------------------
+-- Columns
+-- -------------------------------
+ALTER TABLE active_alarms
+    ADD COLUMN IF NOT EXISTS severity       TEXT,
+    ADD COLUMN IF NOT EXISTS alarm_name     TEXT,
+    ADD COLUMN IF NOT EXISTS ne_name        TEXT,
+    ADD COLUMN IF NOT EXISTS object_type    TEXT,
+    ADD COLUMN IF NOT EXISTS ops_span       TEXT,
+    ADD COLUMN IF NOT EXISTS first_detected TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS last_detected  TIMESTAMPTZ;
+
+ALTER TABLE alarm_history
+    ADD COLUMN IF NOT EXISTS severity       TEXT,
+    ADD COLUMN IF NOT EXISTS alarm_name     TEXT,
+    ADD COLUMN IF NOT EXISTS ne_name        TEXT,
+    ADD COLUMN IF NOT EXISTS object_type    TEXT,
+    ADD COLUMN IF NOT EXISTS ops_span       TEXT,
+    ADD COLUMN IF NOT EXISTS first_detected TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS last_detected  TIMESTAMPTZ;
+
+-- -------------------------------
+-- Sync trigger
+-- -------------------------------
+CREATE OR REPLACE FUNCTION sync_alarm_columns()
+RETURNS trigger AS $$
+BEGIN
+  NEW.severity       := NEW.alarm->>'severity';
+  NEW.alarm_name     := NEW.alarm->>'alarm_name';
+  NEW.ne_name        := NEW.alarm->>'ne_name';
+  NEW.object_type    := NEW.alarm->>'object_type';
+  NEW.ops_span       := alarm_ops_span(NEW.alarm->>'affected_object_name');
+  NEW.first_detected := alarm_ts(NEW.alarm->>'first_detected');
+  NEW.last_detected  := alarm_ts(NEW.alarm->>'last_detected');
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_active_alarms_columns ON active_alarms;
+
+CREATE TRIGGER trg_active_alarms_columns
+BEFORE INSERT OR UPDATE OF alarm ON active_alarms
+FOR EACH ROW
+EXECUTE FUNCTION sync_alarm_columns();
+
+DROP TRIGGER IF EXISTS trg_alarm_history_columns ON alarm_history;
+
+CREATE TRIGGER trg_alarm_history_columns
+BEFORE INSERT OR UPDATE OF alarm ON alarm_history
+FOR EACH ROW
+EXECUTE FUNCTION sync_alarm_columns();
+
+-- -------------------------------
+-- Backfill existing rows
+-- -------------------------------
+-- trg_active_alarms_updated (bootstrap) fires on ANY update and would
+-- set last_updated = now() on every row, making all alarms look fresh
+-- to the last_updated index and stale-alarm cleanup. It is disabled for
+-- the backfill, in one transaction so a failure cannot leave it off.
+BEGIN;
+
+ALTER TABLE active_alarms DISABLE TRIGGER trg_active_alarms_updated;
+
+UPDATE active_alarms SET
+    severity       = alarm->>'severity',
+    alarm_name     = alarm->>'alarm_name',
+    ne_name        = alarm->>'ne_name',
+    object_type    = alarm->>'object_type',
+    ops_span       = alarm_ops_span(alarm->>'affected_object_name'),
+    first_detected = alarm_ts(alarm->>'first_detected'),
+    last_detected  = alarm_ts(alarm->>'last_detected')
+WHERE alarm_name IS NULL AND alarm ? 'alarm_name';
+
+ALTER TABLE active_alarms ENABLE TRIGGER trg_active_alarms_updated;
+
+COMMIT;
+
+UPDATE alarm_history SET
+    severity       = alarm->>'severity',
+    alarm_name     = alarm->>'alarm_name',
+    ne_name        = alarm->>'ne_name',
+    object_type    = alarm->>'object_type',
+    ops_span       = alarm_ops_span(alarm->>'affected_object_name'),
+    first_detected = alarm_ts(alarm->>'first_detected'),
+    last_detected  = alarm_ts(alarm->>'last_detected')
+WHERE alarm_name IS NULL AND alarm ? 'alarm_name';
+
+-- -------------------------------
+-- Indexes
+-- -------------------------------
+DROP INDEX IF EXISTS idx_active_alarms_alarm_gin;
+DROP INDEX IF EXISTS idx_alarm_history_alarm_gin;
+
+-- Correlation warm-up: (alarm_name, severity / object_type)
+CREATE INDEX IF NOT EXISTS idx_active_alarms_name_severity
+ON active_alarms (alarm_name, severity);
+
+CREATE INDEX IF NOT EXISTS idx_active_alarms_severity
+ON active_alarms (severity);
+
+CREATE INDEX IF NOT EXISTS idx_active_alarms_ne_name
+ON active_alarms (ne_name);
+
+CREATE INDEX IF NOT EXISTS idx_active_alarms_ops_span
+ON active_alarms (ops_span);
+
+CREATE INDEX IF NOT EXISTS idx_active_alarms_last_detected
+ON active_alarms (last_detected);
+
+CREATE INDEX IF NOT EXISTS idx_active_alarms_last_updated
+ON active_alarms (last_updated);
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_cleared_at
+ON alarm_history (cleared_at);
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_severity
+ON alarm_history (severity);
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_ne_name
+ON alarm_history (ne_name);
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_alarm_name
+ON alarm_history (alarm_name);
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_last_detected
+ON alarm_history (last_detected);
@@ -0,0 +1,18 @@
+-- ===============================
+-- 002: keyset pagination indexes
+-- ===============================
+-- alarm_view pages with
+--   ORDER BY <ts> DESC, alarm_id DESC
+--   WHERE (<ts>, alarm_id) < (%s, %s)
+-- which a (ts, alarm_id) btree serves with a backward index scan,
+-- so any page costs the same as the first one.
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_cleared_at_id
+ON alarm_history (cleared_at, alarm_id);
+
+CREATE INDEX IF NOT EXISTS idx_active_alarms_last_updated_id
+ON active_alarms (last_updated, alarm_id);
+
+-- Superseded by the composite indexes above
+DROP INDEX IF EXISTS idx_alarm_history_cleared_at;
+DROP INDEX IF EXISTS idx_active_alarms_last_updated;
@@ -0,0 +1,151 @@
+-- ===============================
+-- 003: monthly range partitions for alarm_history
+-- ===============================
+-- alarm_history becomes PARTITION BY RANGE (cleared_at), one partition
+-- per calendar month (UTC), named alarm_history_YYYY_MM, plus
+-- alarm_history_default as a safety net for rows outside them.
+--
+-- Retention (cleanup_history.py) detaches and drops whole partitions
+-- instead of DELETEing rows, and time-bounded queries only scan the
+-- partitions they need.
+--
+-- Partition management goes through SECURITY DEFINER functions, so
+-- the application user can run maintenance without owning the table.
+--
+-- Idempotent: the conversion only runs while alarm_history is a plain
+-- table.
+
+-- -------------------------------
+-- Partition management
+-- -------------------------------
+CREATE OR REPLACE FUNCTION create_alarm_history_partition(month DATE)
+RETURNS TEXT AS $$
+DECLARE
+  lo   TIMESTAMPTZ := date_trunc('month', month)::timestamp AT TIME ZONE 'UTC';
+  hi   TIMESTAMPTZ := (date_trunc('month', month) + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+  part TEXT := 'alarm_history_' || to_char(month, 'YYYY_MM');
+BEGIN
+  IF to_regclass(part) IS NOT NULL THEN
+    RETURN NULL;   -- already there
+  END IF;
+
+  EXECUTE format('CREATE TABLE %I (LIKE alarm_history INCLUDING DEFAULTS)', part);
+
+  -- Rows that landed in the default partition for this month move over,
+  -- otherwise ATTACH would fail the default partition's new constraint
+  IF to_regclass('alarm_history_default') IS NOT NULL THEN
+    EXECUTE format(
+      'WITH moved AS (
+         DELETE FROM alarm_history_default
+         WHERE cleared_at >= %L AND cleared_at < %L
+         RETURNING *
+       )
+       INSERT INTO %I SELECT * FROM moved',
+      lo, hi, part
+    );
+  END IF;
+
+  EXECUTE format(
+    'ALTER TABLE alarm_history ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+    part, lo, hi
+  );
+
+  RETURN part;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION drop_alarm_history_partition(part TEXT, detach_only BOOLEAN DEFAULT false)
+RETURNS BOOLEAN AS $$
+BEGIN
+  IF part !~ '^alarm_history_\d{4}_\d{2}$' THEN
+    RAISE EXCEPTION 'not a monthly alarm_history partition: %', part;
+  END IF;
+
+  IF NOT EXISTS (
+    SELECT 1
+    FROM pg_inherits
+    WHERE inhparent = 'alarm_history'::regclass
+      AND inhrelid = to_regclass(part)
+  ) THEN
+    RETURN false;   -- already detached / dropped
+  END IF;
+
+  EXECUTE format('ALTER TABLE alarm_history DETACH PARTITION %I', part);
+
+  IF NOT detach_only THEN
+    EXECUTE format('DROP TABLE %I', part);
+  END IF;
+
+  RETURN true;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- SECURITY DEFINER: run with the owner's rights, so never by PUBLIC
+-- (the default). bootstrap_postgres_nsp.sh grants EXECUTE to the
+-- application user only.
+REVOKE EXECUTE ON FUNCTION create_alarm_history_partition(DATE) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION drop_alarm_history_partition(TEXT, BOOLEAN) FROM PUBLIC;
+
+-- -------------------------------
+-- Convert the plain table (one-time)
+-- -------------------------------
+DO $$
+DECLARE
+  first_month DATE;
+  m DATE;
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'alarm_history'::regclass) <> 'r' THEN
+    RETURN;   -- already partitioned
+  END IF;
+
+  ALTER TABLE alarm_history RENAME TO alarm_history_legacy;
+
+  CREATE TABLE alarm_history (
+    LIKE alarm_history_legacy INCLUDING DEFAULTS,
+    PRIMARY KEY (alarm_id, cleared_at)
+  ) PARTITION BY RANGE (cleared_at);
+
+  CREATE TABLE alarm_history_default PARTITION OF alarm_history DEFAULT;
+
+  SELECT date_trunc('month', COALESCE(min(cleared_at), now()) AT TIME ZONE 'UTC')::date
+  INTO first_month
+  FROM alarm_history_legacy;
+
+  m := first_month;
+  WHILE m <= (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months')::date LOOP
+    PERFORM create_alarm_history_partition(m);
+    m := (m + interval '1 month')::date;
+  END LOOP;
+
+  -- Typed columns are copied as-is; the sync trigger is added below
+  INSERT INTO alarm_history SELECT * FROM alarm_history_legacy;
+
+  DROP TABLE alarm_history_legacy;
+END;
+$$;
+
+-- -------------------------------
+-- Trigger + indexes on the partitioned parent
+-- (cascade to every current and future partition)
+-- -------------------------------
+DROP TRIGGER IF EXISTS trg_alarm_history_columns ON alarm_history;
+
+CREATE TRIGGER trg_alarm_history_columns
+BEFORE INSERT OR UPDATE OF alarm ON alarm_history
+FOR EACH ROW
+EXECUTE FUNCTION sync_alarm_columns();
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_cleared_at_id
+ON alarm_history (cleared_at, alarm_id);
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_severity
+ON alarm_history (severity);
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_ne_name
+ON alarm_history (ne_name);
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_alarm_name
+ON alarm_history (alarm_name);
+
+CREATE INDEX IF NOT EXISTS idx_alarm_history_last_detected
+ON alarm_history (last_detected);
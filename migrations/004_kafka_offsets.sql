@@ -0,0 +1,17 @@
+-- ===============================
+-- 004: Kafka offsets stored with the alarm writes
+-- ===============================
+-- next_offset is the offset of the next message to consume. It is
+-- written in the same transaction as the alarm changes it covers, and
+-- the consumer seeks to it on partition assignment. Rows are per topic,
+-- i.e. per NSP subscription: a restart resumes where it left off only
+-- while it reuses the same subscription (see 005_kafka_subscriptions).
+
+CREATE TABLE IF NOT EXISTS kafka_offsets (
+    consumer_name TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    partition INT NOT NULL,
+    next_offset BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (consumer_name, topic, partition)
+);
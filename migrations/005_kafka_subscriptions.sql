@@ -0,0 +1,16 @@
+-- ===============================
+-- 005: NSP subscription kept across restarts
+-- ===============================
+-- Every NSP subscription gets its own Kafka topic (ns-eg-<id>), and
+-- kafka_offsets is keyed by topic. The consumer therefore stores its
+-- subscription here, renews and reuses it on restart, and does not
+-- delete it on shutdown. Only when it no longer exists (e.g. expired
+-- while the consumer was down) is a new one created; the offsets of the
+-- old topic are deleted then.
+
+CREATE TABLE IF NOT EXISTS kafka_subscriptions (
+    consumer_name TEXT PRIMARY KEY,
+    subscription_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
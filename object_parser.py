@@ -12,3 +12,19 @@ def parse_affected_object(obj):
             parsed["port"] = p
 
     return parsed
+
+
+def extract_ops_span(name):
+    """
+    Extract OPS shelf/slot span.
+    Example:
+      Benapole/OPS-3-7-A3,OCH,RCV  -> OPS-3-7
+      Jessore/OPS-3-3-SIG2,OCH    -> OPS-3-3
+    """
+    if not name:
+        return None
+
+    for part in name.split("/"):
+        if part.startswith("OPS-"):
+            return "-".join(part.split("-")[:3])
+    return None
@@ -0,0 +1,227 @@
+"""
+offset_store.py
+
+Kafka consumer offsets kept in Postgres (table kafka_offsets).
+
+The next offset to consume per (topic, partition) is upserted in the
+SAME transaction as the alarm writes of those messages, and the consumer
+seeks to it whenever partitions are assigned. A crash can then neither
+lose written alarms' offsets nor skip unwritten messages, independent
+of group.id and of Kafka's own committed offsets.
+
+Messages that write nothing (dropped, duplicates) only advance the
+pending offsets; these are stored with the next write, or by flush()
+every COMMIT_INTERVAL_MS. At worst, a crash replays a few already
+dropped messages.
+
+Offsets belong to one NSP subscription (each has its own topic), so
+the subscription is stored too (table kafka_subscriptions) and reused
+on restart; see load_subscription() / save_subscription().
+
+Environment:
+  OFFSET_STORE        postgres (default) | kafka (Kafka commits only)
+  OFFSET_STORE_NAME   key for this consumer's rows (default nsp-alarms)
+"""
+
+import logging
+import os
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from db_pool import get_conn
+
+log = logging.getLogger(__name__)
+
+OFFSET_STORE = os.getenv("OFFSET_STORE", "postgres")
+OFFSET_STORE_NAME = os.getenv("OFFSET_STORE_NAME", "nsp-alarms")
+
+# Reading stored offsets on assignment: 1 s, 2 s, 4 s, 8 s between attempts
+LOAD_ATTEMPTS = 5
+LOAD_RETRY_SECONDS = 1
+
+
+class OffsetLoadError(RuntimeError):
+    """
+    Stored offsets could not be read on partition assignment. Fatal:
+    consuming from Kafka's committed / reset offsets instead could skip
+    or replay messages.
+    """
+
+SAVE_OFFSETS_SQL = """
+INSERT INTO kafka_offsets (consumer_name, topic, partition, next_offset)
+VALUES %s
+ON CONFLICT (consumer_name, topic, partition)
+DO UPDATE SET
+    next_offset = GREATEST(kafka_offsets.next_offset, EXCLUDED.next_offset),
+    updated_at = now();
+"""
+
+LOAD_SUBSCRIPTION_SQL = """
+SELECT subscription_id, topic
+FROM kafka_subscriptions
+WHERE consumer_name = %s;
+"""
+
+SAVE_SUBSCRIPTION_SQL = """
+INSERT INTO kafka_subscriptions (consumer_name, subscription_id, topic)
+VALUES (%s, %s, %s)
+ON CONFLICT (consumer_name)
+DO UPDATE SET
+    subscription_id = EXCLUDED.subscription_id,
+    topic = EXCLUDED.topic,
+    updated_at = now();
+"""
+
+# Offsets of topics of earlier (gone) subscriptions
+DELETE_STALE_OFFSETS_SQL = """
+DELETE FROM kafka_offsets
+WHERE consumer_name = %s
+  AND topic <> %s;
+"""
+
+LOAD_OFFSETS_SQL = """
+SELECT topic, partition, next_offset
+FROM kafka_offsets
+WHERE consumer_name = %s
+  AND topic = ANY(%s);
+"""
+
+
+def write_offsets(cur, offsets, name=OFFSET_STORE_NAME):
+    """
+    Upsert {(topic, partition): next_offset} on `cur` (caller's transaction).
+    """
+    execute_values(
+        cur,
+        SAVE_OFFSETS_SQL,
+        [(name, topic, partition, offset) for (topic, partition), offset in offsets.items()],
+        page_size=len(offsets),
+    )
+
+
+class OffsetStore:
+    def __init__(self, enabled=(OFFSET_STORE == "postgres"), name=OFFSET_STORE_NAME):
+        self.enabled = enabled
+        self.name = name
+        self._lock = threading.Lock()
+        self._pending = {}   # (topic, partition) -> next offset, not yet stored
+
+    # ---------------------------
+    # Tracking
+    # ---------------------------
+    def mark(self, topic, partition, offset):
+        """
+        Message at `offset` has been handled (written or skipped).
+        """
+        if self.enabled:
+            with self._lock:
+                self._pending[(topic, partition)] = offset + 1
+
+    def pending(self):
+        """
+        Snapshot to pass to a write transaction; None when disabled / empty.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            return dict(self._pending) or None
+
+    def stored(self, offsets):
+        """
+        `offsets` (a pending() snapshot) were committed with a write.
+        """
+        if not offsets:
+            return
+        with self._lock:
+            for tp, offset in offsets.items():
+                if self._pending.get(tp) == offset:
+                    del self._pending[tp]
+
+    def save(self, offsets):
+        """
+        Store offsets in their own transaction.
+        """
+        if not self.enabled or not offsets:
+            return
+        with get_conn() as conn, conn.cursor() as cur:
+            write_offsets(cur, offsets, self.name)
+        self.stored(offsets)
+
+    def flush(self):
+        self.save(self.pending())
+
+    def forget(self, partitions):
+        with self._lock:
+            for tp in partitions:
+                self._pending.pop(tp, None)
+
+    # ---------------------------
+    # Resume
+    # ---------------------------
+    def load(self, topics):
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(LOAD_OFFSETS_SQL, (self.name, list(topics)))
+            return {(topic, partition): offset for topic, partition, offset in cur.fetchall()}
+
+    def load_retrying(self, topics, attempts=LOAD_ATTEMPTS, delay=LOAD_RETRY_SECONDS):
+        """
+        load() with bounded retries; raises OffsetLoadError when exhausted.
+        """
+        for attempt in range(1, attempts + 1):
+            try:
+                return self.load(topics)
+            except Exception as e:
+                if attempt == attempts:
+                    log.critical("❌ Stored offsets unreadable, stopping consumer", extra={"attempts": attempts})
+                    raise OffsetLoadError(f"stored offsets unreadable after {attempts} attempts: {e}") from e
+                log.warning("⚠️ Stored offset load failed, retrying: %s", e, extra={"attempt": attempt})
+                time.sleep(delay)
+                delay *= 2
+
+    def seek_assigned(self, consumer, partitions):
+        """
+        on_assign callback: start every assigned partition at its stored
+        offset (partitions without one keep Kafka's committed / reset).
+        Raises OffsetLoadError (out of poll / consume) if the stored
+        offsets cannot be read; the consumer loops treat it as fatal.
+        """
+        if self.enabled:
+            stored = self.load_retrying({p.topic for p in partitions})
+            for p in partitions:
+                offset = stored.get((p.topic, p.partition))
+                if offset is not None:
+                    p.offset = offset
+            log.info(
+                "⏮️ Resuming from stored offsets",
+                extra={"offsets": {f"{t}[{p}]": o for (t, p), o in stored.items()}},
+            )
+        consumer.assign(partitions)
+
+
+# -------------------------------
+# Subscription (one topic per subscription)
+# -------------------------------
+def load_subscription(name=OFFSET_STORE_NAME):
+    """
+    (subscription_id, topic) stored for this consumer, or None.
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(LOAD_SUBSCRIPTION_SQL, (name,))
+        return cur.fetchone()
+
+
+def save_subscription(subscription_id, topic, name=OFFSET_STORE_NAME):
+    """
+    Store a new subscription and drop the offsets of older topics.
+    Returns the number of stale offset rows deleted.
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(SAVE_SUBSCRIPTION_SQL, (name, subscription_id, topic))
+        cur.execute(DELETE_STALE_OFFSETS_SQL, (name, topic))
+        return cur.rowcount
+
+
+# Shared instance for the consumer process
+consumed_offsets = OffsetStore()
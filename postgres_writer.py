@@ -1,31 +1,6 @@
-import psycopg2
 import json
-from contextlib import contextmanager
-from datetime import datetime
 
-# -------------------------------
-# Database configuration
-# -------------------------------
-DB_CONFIG = {
-    "host": "127.0.0.1",
-    "port": 5432,
-    "dbname": "nsp",
-    "user": "nsp_user",
-    "password": "nsp_pass",
-}
-
-
-@contextmanager
-def get_conn():
-    conn = psycopg2.connect(**DB_CONFIG)
-    try:
-        yield conn
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+from db_pool import get_conn
 
 
 # -------------------------------
@@ -1,5 +1,5 @@
-import requests
-from configuration import SUBSCRIPTION_URL, VERIFY_SSL
+from configuration import SUBSCRIPTION_URL
+from http_session import request
 
 
 def renew_subscription(token_mgr, subscription_id):
@@ -10,5 +10,5 @@ def renew_subscription(token_mgr, subscription_id):
         "Content-Type": "application/json"
     }
 
-    response = requests.post(url, headers=headers, json={}, verify=VERIFY_SSL)
+    response = request("POST", url, headers=headers, json={})
     response.raise_for_status()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+replay_benchmark.py
+
+Offline replay + throughput benchmark for the alarm pipeline.
+
+Feeds captured NSP notifications (JSONL, one Kafka payload per line,
+same shape as the events in kafka_notification.txt) through the real
+decode -> normalize_alarm -> should_drop_alarm -> handle_alarm_lifecycle
+path, without NSP or Kafka.
+
+Storage:
+  --store memory    in-process stand-in for active_alarms / alarm_history
+  --store postgres  real Postgres from db_pool.DB_CONFIG (use a scratch DB!)
+
+Reports messages/sec, p50/p99 latency per stage, DB round-trips per
+message and drop counts.
+"""
+
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from contextlib import contextmanager
+
+import alarm_lifecycle
+import codec
+import alarm_normalizer
+from active_alarm_index import active_index, active_children
+
+
+# -------------------------------
+# Stats
+# -------------------------------
+STAGES = ("decode", "normalize", "filter", "lifecycle")
+
+
+class ReplayStats:
+    def __init__(self):
+        self.latencies = {stage: [] for stage in STAGES}
+        self.counts = Counter()
+        self.db_round_trips = 0
+        self.filter_seconds = 0.0   # running total, see install_filter_timer
+
+    def record(self, stage, seconds):
+        self.latencies[stage].append(seconds)
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of an unsorted list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+# -------------------------------
+# DB round-trip counting
+# -------------------------------
+class CountingCursor:
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, *args, **kwargs):
+        self._stats.db_round_trips += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    def __init__(self, conn, stats):
+        self._conn = conn
+        self._stats = stats
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._stats)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def counting_get_conn(get_conn, stats):
+    @contextmanager
+    def wrapped():
+        with get_conn() as conn:
+            yield CountingConnection(conn, stats)
+        stats.db_round_trips += 1  # COMMIT
+    return wrapped
+
+
+# -------------------------------
+# In-memory storage stand-in
+# -------------------------------
+class MemoryStore:
+    """
+    Minimal stand-in for active_alarms / alarm_history that understands
+    the statements issued by alarm_lifecycle.
+    """
+
+    def __init__(self):
+        self.active = {}
+        self.history = []
+
+    @contextmanager
+    def get_conn(self):
+        yield MemoryConnection(self)
+
+
+class MemoryConnection:
+    def __init__(self, store):
+        self.store = store
+
+    def cursor(self):
+        return MemoryCursor(self.store)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class MemoryCursor:
+    def __init__(self, store):
+        self.store = store
+        self._rows = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+    def execute(self, sql, params=()):
+        if sql == alarm_lifecycle.UPSERT_ACTIVE_SQL:
+            alarm_id, doc = params
+            self.store.active[alarm_id] = codec.loads(str(doc))
+            self._rows, self.rowcount = [], 1
+
+        elif sql == alarm_lifecycle.MERGE_CHANGE_SQL:
+            stored = self.store.active.get(params["alarm_id"])
+            changes = codec.loads(str(params["changes"]))
+            if stored is not None and any(stored.get(k) != v for k, v in changes.items()):
+                stored.update(changes)
+                self._rows = [(stored,)]
+            else:
+                self._rows = []
+            self.rowcount = len(self._rows)
+
+        elif sql == alarm_lifecycle.MOVE_CLEARED_SQL:
+            alarm_id = params[0]
+            alarm = self.store.active.pop(alarm_id, None)
+            if alarm is not None:
+                self.store.history.append((alarm_id, alarm))
+            self._rows, self.rowcount = [], int(alarm is not None)
+
+        elif sql == alarm_lifecycle.RETRACT_CHILDREN_SQL:
+            removed = [self.store.active.pop(alarm_id, None) for alarm_id in params[0]]
+            self._rows, self.rowcount = [], sum(alarm is not None for alarm in removed)
+
+        else:
+            raise NotImplementedError(f"MemoryStore does not support: {sql.strip()[:60]}")
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+
+# -------------------------------
+# Replay
+# -------------------------------
+def read_payloads(path, repeat=1, limit=None):
+    """
+    Yield raw payload bytes (one Kafka message value per JSONL line).
+    """
+    sent = 0
+    for _ in range(repeat):
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if limit is not None and sent >= limit:
+                    return
+                sent += 1
+                yield line
+
+
+def install_filter_timer(stats):
+    """
+    Time the filter (drop_reason) separately from the rest of
+    normalize_alarm, and count drops per rule.
+    """
+    drop_reason = alarm_normalizer.drop_reason
+
+    def timed(**kwargs):
+        started = time.perf_counter()
+        try:
+            reason = drop_reason(**kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.record("filter", elapsed)
+            stats.filter_seconds += elapsed
+        if reason:
+            stats.counts[f"dropped:{reason}"] += 1
+        return reason
+
+    alarm_normalizer.drop_reason = timed
+
+
+def replay(payloads, stats):
+    clock = time.perf_counter
+
+    for raw in payloads:
+        stats.counts["messages"] += 1
+
+        started = clock()
+        try:
+            event = codec.loads(raw)
+        except Exception:
+            stats.counts["invalid_json"] += 1
+            continue
+        finally:
+            stats.record("decode", clock() - started)
+
+        filter_before = stats.filter_seconds
+        started = clock()
+        try:
+            alarm = alarm_normalizer.normalize_alarm(event)
+        except Exception:
+            stats.counts["normalize_errors"] += 1
+            continue
+        finally:
+            # normalize latency excludes the filter call it made
+            elapsed = clock() - started
+            stats.record("normalize", elapsed - (stats.filter_seconds - filter_before))
+
+        if not alarm:
+            continue
+
+        started = clock()
+        try:
+            alarm_lifecycle.handle_alarm_lifecycle(alarm)
+            stats.counts["kept"] += 1
+        except Exception:
+            stats.counts["lifecycle_errors"] += 1
+        finally:
+            stats.record("lifecycle", clock() - started)
+
+
+def print_report(stats, elapsed):
+    messages = stats.counts["messages"]
+    rate = messages / elapsed if elapsed > 0 else 0.0
+
+    print("\n📊 REPLAY REPORT\n")
+    print(f"messages          {messages}")
+    print(f"elapsed           {elapsed:.3f} s")
+    print(f"throughput        {rate:,.0f} msg/s")
+    print(f"json backend      {codec.BACKEND}")
+    print(f"db round-trips    {stats.db_round_trips} ({stats.db_round_trips / max(messages, 1):.2f} / msg)")
+
+    print("\nstage             count      p50 (µs)   p99 (µs)")
+    for stage in STAGES:
+        values = stats.latencies[stage]
+        print(
+            f"{stage:<16}  {len(values):>7}  "
+            f"{percentile(values, 50) * 1e6:>10.1f} {percentile(values, 99) * 1e6:>10.1f}"
+        )
+
+    print("\ncounts")
+    for name, count in sorted(stats.counts.items()):
+        if name != "messages":
+            print(f"  {name:<20} {count}")
+
+
+# -------------------------------
+# CLI
+# -------------------------------
+def main():
+    parser = ArgumentParser("NSP Alarm Replay Benchmark")
+    parser.add_argument("jsonl", help="Captured notifications, one JSON payload per line")
+    parser.add_argument("--store", choices=["memory", "postgres"], default="memory")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the file N times")
+    parser.add_argument("--limit", type=int, help="Stop after N messages")
+    parser.add_argument("--no-warm", action="store_true", help="Skip correlation index warm-up (postgres)")
+    args = parser.parse_args()
+
+    stats = ReplayStats()
+
+    if args.store == "memory":
+        store = MemoryStore()
+        alarm_lifecycle.get_conn = counting_get_conn(store.get_conn, stats)
+        active_index.warm([])
+        active_children.warm([])
+    else:
+        alarm_lifecycle.get_conn = counting_get_conn(alarm_lifecycle.get_conn, stats)
+        if not args.no_warm:
+            roots = alarm_lifecycle.warm_active_index()
+            print(f"🧠 Correlation index warmed with {roots} active root alarms")
+        stats.db_round_trips = 0
+
+    install_filter_timer(stats)
+
+    # Load payloads up front so file I/O is not part of the measurement
+    payloads = list(read_payloads(args.jsonl, args.repeat, args.limit))
+
+    started = time.perf_counter()
+    replay(payloads, stats)
+    elapsed = time.perf_counter() - started
+
+    print_report(stats, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
-import requests
+import logging
 from requests.auth import HTTPBasicAuth
-from configuration import REVOKE_URL, VERIFY_SSL, USERNAME, PASSWORD
+from configuration import REVOKE_URL, USERNAME, PASSWORD
+from http_session import request
+
+log = logging.getLogger(__name__)
 
 
 def revoke_token(access_token):
     """
     Revoke NSP access token (mandatory clean logout)
     """
-    response = requests.post(
+    response = request(
+        "POST",
         REVOKE_URL,
         auth=HTTPBasicAuth(USERNAME, PASSWORD),
         headers={"Content-Type": "application/x-www-form-urlencoded"},
@@ -15,8 +19,7 @@ def revoke_token(access_token):
             "token": access_token,
             "token_type_hint": "token",
         },
-        verify=VERIFY_SSL
     )
 
     response.raise_for_status()
-    print("🔒 Token revoked")
+    log.info("🔒 Token revoked")
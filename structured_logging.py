@@ -0,0 +1,186 @@
+"""
+structured_logging.py
+
+Non-blocking, one-line structured logging for the consumer process.
+
+- Every record is one JSON line (ts, level, logger, msg + extra fields).
+- Loggers only enqueue; formatting and stdout I/O happen on a
+  background QueueListener thread, never on the consumer thread.
+- Per-alarm logs ("nsp.alarms") can be sampled during storms.
+
+Environment:
+  LOG_LEVEL              root level (default INFO)
+  LOG_ALARM_BURST        per-alarm logs passed per second before sampling
+                         (0 = no sampling, default)
+  LOG_ALARM_SAMPLE_EVERY keep 1 of every N per-alarm logs above the burst
+"""
+
+import copy
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from codec import EncodedJSON, dumps
+
+ALARM_LOGGER = "nsp.alarms"
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_ALARM_BURST = int(os.getenv("LOG_ALARM_BURST", "0"))
+LOG_ALARM_SAMPLE_EVERY = int(os.getenv("LOG_ALARM_SAMPLE_EVERY", "100"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+}
+
+
+# -------------------------------
+# Formatting (listener thread)
+# -------------------------------
+class JsonLineFormatter(logging.Formatter):
+    def format(self, record):
+        doc = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+
+        encoded = []
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                if isinstance(value, EncodedJSON):
+                    encoded.append((key, value))
+                else:
+                    doc[key] = value
+
+        if record.exc_info:
+            doc["exc"] = "".join(traceback.format_exception(*record.exc_info))
+
+        line = dumps(doc)
+
+        # Splice in pre-encoded documents (e.g. the alarm) verbatim
+        if encoded:
+            line = line[:-1] + "".join(f",{dumps(key)}:{value}" for key, value in encoded) + "}"
+
+        return line
+
+
+# -------------------------------
+# Enqueue only (caller thread)
+# -------------------------------
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that defers ALL formatting to the listener thread
+    and drops (and counts) records instead of blocking when full.
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The stock prepare() formats on the caller thread; don't.
+        return copy.copy(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# -------------------------------
+# Storm sampling
+# -------------------------------
+class StormSampler(logging.Filter):
+    """
+    Pass the first `burst` records of each second, then 1 of every `every`.
+    Passed records carry how many were suppressed since the previous one.
+    """
+
+    def __init__(self, burst, every):
+        super().__init__()
+        self.burst = burst
+        self.every = max(every, 1)
+        self._lock = threading.Lock()
+        self._second = 0
+        self._seen = 0
+        self._suppressed = 0
+
+    def filter(self, record):
+        now = int(time.monotonic())
+
+        with self._lock:
+            if now != self._second:
+                self._second = now
+                self._seen = 0
+
+            self._seen += 1
+            over = self._seen - self.burst
+
+            if over > 0 and over % self.every:
+                self._suppressed += 1
+                return False
+
+            if self._suppressed:
+                record.suppressed = self._suppressed
+                self._suppressed = 0
+            return True
+
+
+# -------------------------------
+# Setup / teardown
+# -------------------------------
+_listener = None
+
+
+def setup_logging(level=LOG_LEVEL):
+    """
+    Route all logging through a background queue listener. Idempotent.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    q = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonLineFormatter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [NonBlockingQueueHandler(q)]
+    root.setLevel(level)
+
+    if LOG_ALARM_BURST > 0:
+        logging.getLogger(ALARM_LOGGER).addFilter(
+            StormSampler(LOG_ALARM_BURST, LOG_ALARM_SAMPLE_EVERY)
+        )
+
+    _listener = QueueListener(q, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """
+    Flush queued records and stop the listener thread.
+    Records logged afterwards (late shutdown messages) are written
+    synchronously instead of being lost.
+    """
+    global _listener
+    if _listener is None:
+        return
+
+    _listener.stop()
+    logging.getLogger().handlers[:] = list(_listener.handlers)
+    _listener = None
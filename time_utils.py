@@ -0,0 +1,82 @@
+"""
+time_utils.py
+
+Timestamp handling for the alarm pipeline.
+
+Inside the pipeline timestamps are epoch milliseconds (int), so
+correlation windows are plain integer comparisons. ISO strings are
+only produced at the storage / display boundary, in the fixed local
+zone, and memoized: the same firstTimeDetected / lastTimeDetected
+values repeat on every alarm-change of an alarm.
+"""
+
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+# Asia/Dhaka has had no DST since 2009: a fixed offset is exact and
+# avoids a tz database lookup per conversion.
+LOCAL_TZ = timezone(timedelta(hours=6), "Asia/Dhaka")
+
+_FORMAT_CACHE_SIZE = 4096
+
+
+def epoch_ms(ts):
+    """
+    NSP timestamp (int / float / digit string / ISO string as in the REST
+    alarm list / {"value"|"milliseconds"|"seconds"}) -> epoch ms as int, or None.
+    """
+    if ts is None:
+        return None
+
+    if isinstance(ts, dict):
+        ts = (
+            ts.get("value")
+            or ts.get("milliseconds")
+            or (ts.get("seconds", 0) * 1000)
+        )
+
+    if isinstance(ts, str):
+        if not ts.isdigit():
+            return iso_to_epoch_ms(ts)
+        ts = int(ts)
+
+    if isinstance(ts, bool) or not isinstance(ts, (int, float)):
+        return None
+
+    return int(ts)
+
+
+@lru_cache(maxsize=_FORMAT_CACHE_SIZE)
+def format_local_iso(ms):
+    """
+    Epoch ms -> ISO string in LOCAL_TZ, e.g. 2026-01-23T17:05:10+06:00.
+    """
+    if ms is None:
+        return None
+    try:
+        return datetime.fromtimestamp(ms / 1000, tz=LOCAL_TZ).isoformat()
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=_FORMAT_CACHE_SIZE)
+def iso_to_epoch_ms(value):
+    """
+    Stored ISO string (any offset, or trailing Z) -> epoch ms, or None.
+    """
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return round(dt.timestamp() * 1000)
+
+
+def window_ms(window):
+    """
+    timedelta -> milliseconds (int).
+    """
+    return round(window.total_seconds() * 1000)
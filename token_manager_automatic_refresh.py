@@ -1,7 +1,18 @@
+import logging
+import random
+import threading
 import time
-import requests
 from requests.auth import HTTPBasicAuth
-from configuration import AUTH_URL, VERIFY_SSL
+from configuration import AUTH_URL
+from http_session import request
+
+log = logging.getLogger(__name__)
+
+# Refresh this long before expiry_time, minus up to REFRESH_JITTER_SECONDS
+# so several consumers do not hit the auth endpoint at the same instant
+REFRESH_JITTER_SECONDS = 60
+REFRESH_RETRY_MIN_SECONDS = 5
+REFRESH_RETRY_MAX_SECONDS = 120
 
 
 class TokenManager:
@@ -11,43 +22,91 @@ class TokenManager:
         self.access_token = None
         self.refresh_token = None
         self.expiry_time = 0
+        self._lock = threading.Lock()
         self.authenticate()
 
-    def authenticate(self):
-        response = requests.post(
+    def _post_token(self, body):
+        response = request(
+            "POST",
             AUTH_URL,
             auth=HTTPBasicAuth(self.username, self.password),
-            json={"grant_type": "client_credentials"},
+            json=body,
             headers={"Content-Type": "application/json"},
-            verify=VERIFY_SSL
         )
         response.raise_for_status()
         self._update_tokens(response.json())
 
+    def authenticate(self):
+        self._post_token({"grant_type": "client_credentials"})
+
     def refresh(self):
         if not self.refresh_token:
             self.authenticate()
             return
 
-        response = requests.post(
-            AUTH_URL,
-            auth=HTTPBasicAuth(self.username, self.password),
-            json={
+        try:
+            self._post_token({
                 "grant_type": "refresh_token",
                 "refresh_token": self.refresh_token
-            },
-            headers={"Content-Type": "application/json"},
-            verify=VERIFY_SSL
-        )
-        response.raise_for_status()
-        self._update_tokens(response.json())
+            })
+        except Exception as e:
+            # e.g. refresh token expired / revoked: start a new session
+            log.warning("⚠️ Token refresh failed, re-authenticating: %s", e)
+            self.authenticate()
 
     def _update_tokens(self, data):
         self.access_token = data["access_token"]
         self.refresh_token = data.get("refresh_token")
         self.expiry_time = time.time() + data.get("expires_in", 3600) - 300
 
+    # ---------------------------
+    # Single-flight refresh
+    # ---------------------------
+    def _refresh_if_expired(self, expiry_time):
+        """
+        Refresh unless another thread already did since `expiry_time`
+        was read; concurrent callers wait and reuse its result.
+        """
+        with self._lock:
+            if self.expiry_time == expiry_time:
+                self.refresh()
+
     def get_access_token(self):
-        if time.time() >= self.expiry_time:
-            self.refresh()
+        expiry_time = self.expiry_time
+        if time.time() >= expiry_time:
+            self._refresh_if_expired(expiry_time)
         return self.access_token
+
+    # ---------------------------
+    # Background refresher
+    # ---------------------------
+    def start_refresher(self, stop_event):
+        """
+        Refresh ahead of expiry_time on a daemon thread, so callers
+        (renewal, shutdown) never wait on the auth endpoint.
+        """
+        thread = threading.Thread(
+            target=self._refresh_loop, args=(stop_event,), name="token-refresher", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _refresh_loop(self, stop_event):
+        retry_delay = REFRESH_RETRY_MIN_SECONDS
+
+        while True:
+            expiry_time = self.expiry_time
+            refresh_at = expiry_time - random.uniform(0, REFRESH_JITTER_SECONDS)
+
+            if stop_event.wait(max(0, refresh_at - time.time())):
+                return
+
+            try:
+                self._refresh_if_expired(expiry_time)
+                retry_delay = REFRESH_RETRY_MIN_SECONDS
+                log.info("🔑 Access token refreshed")
+            except Exception as e:
+                log.error("❌ Background token refresh failed: %s", e)
+                if stop_event.wait(retry_delay):
+                    return
+                retry_delay = min(retry_delay * 2, REFRESH_RETRY_MAX_SECONDS)
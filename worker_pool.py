@@ -0,0 +1,214 @@
+"""
+worker_pool.py
+
+Ordered parallel processing for the Kafka consumer.
+
+Messages are dispatched to K worker threads by hashing alarm_id, so
+create / change / clear for the same alarm are always handled by the
+same worker, in order. Kafka offsets are only committed up to the
+lowest offset that has not been finished by every worker.
+
+Intake is throttled by Backpressure (pause / resume on high / low
+water marks) instead of blocking on a full worker queue.
+"""
+
+import heapq
+import logging
+import queue
+import threading
+import time
+import zlib
+
+log = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Offset tracking
+# -------------------------------
+class OffsetTracker:
+    """
+    Per (topic, partition): which dispatched offsets are still in flight.
+
+    The committable offset of a partition is the lowest in-flight offset,
+    or (highest dispatched + 1) once everything has finished.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}     # tp -> min-heap of dispatched offsets
+        self._done = {}        # tp -> finished offsets still in the heap
+        self._next = {}        # tp -> highest dispatched offset + 1
+        self._committed = {}   # tp -> last offset handed out for commit
+
+    def dispatched(self, topic, partition, offset):
+        tp = (topic, partition)
+        with self._lock:
+            heapq.heappush(self._pending.setdefault(tp, []), offset)
+            self._done.setdefault(tp, set())
+            self._next[tp] = max(self._next.get(tp, 0), offset + 1)
+
+    def finished(self, topic, partition, offset):
+        tp = (topic, partition)
+        with self._lock:
+            if tp in self._done:
+                self._done[tp].add(offset)
+
+    def committable(self):
+        """
+        Return {(topic, partition): offset} that advanced since the last call.
+        """
+        result = {}
+
+        with self._lock:
+            for tp, heap in self._pending.items():
+                done = self._done[tp]
+                while heap and heap[0] in done:
+                    done.discard(heapq.heappop(heap))
+
+                offset = heap[0] if heap else self._next[tp]
+                if offset != self._committed.get(tp):
+                    self._committed[tp] = offset
+                    result[tp] = offset
+
+        return result
+
+    def forget(self, partitions):
+        """
+        Drop state for revoked partitions [(topic, partition), ...].
+        """
+        with self._lock:
+            for tp in partitions:
+                self._pending.pop(tp, None)
+                self._done.pop(tp, None)
+                self._next.pop(tp, None)
+                self._committed.pop(tp, None)
+
+
+# -------------------------------
+# Backpressure
+# -------------------------------
+class Backpressure:
+    """
+    Hysteresis gate for intake: pause() once the backlog reaches `high`,
+    resume() once it has drained to `low`.
+    """
+
+    def __init__(self, high, low, pause, resume, clock=time.monotonic):
+        self.high = high
+        self.low = low
+        self._pause = pause
+        self._resume = resume
+        self._clock = clock
+
+        self.paused = False
+        self._since = None
+
+    def update(self, backlog):
+        """
+        Returns the seconds spent paused since the previous call.
+        """
+        if not self.paused:
+            if backlog >= self.high:
+                self._pause()
+                self.paused = True
+                self._since = self._clock()
+            return 0.0
+
+        now = self._clock()
+        elapsed, self._since = now - self._since, now
+
+        if backlog <= self.low:
+            self._resume()
+            self.paused = False
+
+        return elapsed
+
+    def release(self):
+        """
+        Resume unconditionally (e.g. after the backlog was drained on revoke).
+        """
+        return self.update(-1) if self.paused else 0.0
+
+
+# -------------------------------
+# Sharded workers
+# -------------------------------
+_STOP = object()
+
+
+def shard_for(key, workers):
+    """
+    Stable shard for a key (Python's hash() is salted per process).
+    """
+    return zlib.crc32(str(key).encode()) % workers
+
+
+class ShardedWorkerPool:
+    def __init__(self, workers, handler, tracker, queue_size=1000):
+        """
+        handler(item) is called on the worker thread for every item.
+        Exceptions are reported; the offset is marked finished either way.
+        """
+        self.workers = workers
+        self.handler = handler
+        self.tracker = tracker
+
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(
+                target=self._run,
+                args=(q,),
+                name=f"alarm-worker-{i}",
+                daemon=True,
+            )
+            for i, q in enumerate(self._queues)
+        ]
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+
+    def submit(self, key, topic, partition, offset, item):
+        self.tracker.dispatched(topic, partition, offset)
+        self._queues[shard_for(key, self.workers)].put(
+            (topic, partition, offset, item)
+        )
+
+    def backlog(self):
+        """
+        Depth of the fullest worker queue.
+        """
+        return max(q.qsize() for q in self._queues)
+
+    def drain(self):
+        """
+        Block until every queued item has been processed.
+        """
+        for q in self._queues:
+            q.join()
+
+    def stop(self):
+        for q in self._queues:
+            q.put(_STOP)
+        for t in self._threads:
+            t.join()
+
+    def _run(self, q):
+        while True:
+            entry = q.get()
+            try:
+                if entry is _STOP:
+                    return
+
+                topic, partition, offset, item = entry
+                try:
+                    self.handler(item)
+                except Exception:
+                    log.exception(
+                        "❌ Worker failed",
+                        extra={"topic": topic, "partition": partition, "offset": offset},
+                    )
+                finally:
+                    self.tracker.finished(topic, partition, offset)
+            finally:
+                q.task_done()